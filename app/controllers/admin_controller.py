@@ -0,0 +1,92 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
+
+from app.core import profiling, tracing
+from app.core.db import get_pool_status
+from app.core.security import get_current_active_superuser, password_hasher
+from app.services.email_service import email_queue
+
+router = APIRouter(dependencies=[Depends(get_current_active_superuser)])
+
+
+@router.get("/db-pool")
+def read_db_pool():
+    """
+    Connection pool status of the sync and async engines: occupancy (in use, overflow)
+    and checkout statistics (latency percentiles of the latest checkouts, timeouts).
+    """
+    return get_pool_status()
+
+
+@router.get("/password-hasher")
+def read_password_hasher():
+    """Queue and timing statistics of the password hashing pool."""
+    return password_hasher.stats()
+
+
+@router.get("/email-queue")
+def read_email_queue():
+    """Emails waiting in the outbound queue, sent and given up on."""
+    return email_queue.stats()
+
+
+@router.get("/traces")
+def read_slow_traces(limit: int = 20):
+    """Most recent traces slower than TRACE_SLOW_THRESHOLD_SECONDS, newest first."""
+    return [trace.summary() for trace in list(tracing.slow_traces)[::-1][:limit]]
+
+
+@router.get("/traces/{trace_id}")
+def read_trace(trace_id: str):
+    """Span tree of a kept trace (id from the `X-Trace-Id` response header or `/admin/traces`)."""
+    trace = tracing.find_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (fast traces are not kept)")
+    return trace.to_dict()
+
+
+def _profile_response(profile: profiling.Profile, format: str):
+    if format == "svg":
+        return Response(profiling.render_flamegraph(profile), media_type="image/svg+xml")
+    if format == "json":
+        return {**profile.summary(), "stacks": dict(profile.stacks.most_common())}
+    return PlainTextResponse(profile.folded())
+
+
+@router.get("/profiles")
+def read_profiles():
+    """Latest on-demand request profiles (requests sent with `X-Profile: 1`), newest first."""
+    return profiling.list_profiles()
+
+
+@router.get("/profiles/continuous")
+def read_continuous_profile(format: Literal["folded", "svg", "json"] = "folded", reset: bool = False):
+    """Stacks aggregated by the continuous profiler, optionally restarting the aggregation."""
+    profile = profiling.continuous_profiler.snapshot(reset=reset)
+    if profile is None:
+        raise HTTPException(status_code=409, detail="Continuous profiling is not running")
+    return _profile_response(profile, format)
+
+
+@router.post("/profiles/continuous")
+def set_continuous_profiling(enabled: bool, interval_seconds: Optional[float] = Query(default=None, gt=0)):
+    """Start or stop the continuous profiler of this worker, without restarting it."""
+    if enabled:
+        profiling.continuous_profiler.start(interval_seconds)
+    else:
+        profiling.continuous_profiler.stop()
+    return {"running": profiling.continuous_profiler.running}
+
+
+@router.get("/profiles/{profile_id}")
+def read_profile(profile_id: str, format: Literal["folded", "svg", "json"] = "folded"):
+    """
+    Profile of a request (id from its `X-Profile-Id` response header): folded stacks for
+    flamegraph.pl / speedscope, a rendered SVG flame graph, or JSON.
+    """
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return _profile_response(profile, format)
@@ -6,26 +6,27 @@ from datetime import timedelta
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi import Depends, HTTPException, status, APIRouter
 
-from app.core.db import SessionDep
+from app.core.db import SessionDep, AsyncSessionDep
 from app.core.security import ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, \
     get_password_hash, get_current_active_superuser, generate_password_reset_token, \
-    verify_password_reset_token
+    verify_password_reset_token, invalidate_cached_user
 from app.models.schemas_models import Message, NewPassword, Token
-from app.services.user_crud import authenticate_user, get_user
-from app.utils.smtp_utils import generate_reset_password_email, send_email
+from app.services.user_crud import authenticate_user_async, get_user
+from app.services.email_service import email_queue
+from app.utils.smtp_utils import generate_reset_password_email
 
 router = APIRouter()
 
 
 @router.post("/token")
 async def login_for_access_token(
-        db: SessionDep,
+        db: AsyncSessionDep,
         form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -57,7 +58,8 @@ def recover_password(email: EmailStr, session: SessionDep) -> Message:
     email_data = generate_reset_password_email(
         email_to=user.email, email=email, token=password_reset_token
     )
-    send_email(
+    # sent by the background email worker, the request doesn't wait for SMTP
+    email_queue.enqueue(
         email_to=user.email,
         subject=email_data.subject,
         html_content=email_data.html_content,
@@ -85,6 +87,7 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
     user.hashed_password = hashed_password
     session.add(user)
     session.commit()
+    invalidate_cached_user(user.user_id)
     return Message(message="Password updated successfully")
 
 
@@ -1,36 +1,51 @@
-from typing import Any
+from typing import Any, Literal
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 
 import app.services.conversation_crud as conversation_crud
 import app.models.conversation_models as conversation_models
 from uuid import UUID
 
-from app.core.db import SessionDep
+from app.core.db import AsyncSessionDep
 from app.core.security import CurrentUser, get_current_user
 from app.models.schemas_models import Message
 
 session_router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
-@session_router.post("/sessions", response_model=conversation_models.SessionPublic)
-def create_chat_session(payload: conversation_models.SessionCreate, db: SessionDep, current_user: CurrentUser):
-    return conversation_crud.create_session(user_id=current_user.user_id, db=db, **payload.model_dump())
+@session_router.post("/sessions", response_model=conversation_models.SessionMetaPublic)
+async def create_chat_session(payload: conversation_models.SessionCreate, db: AsyncSessionDep,
+                              current_user: CurrentUser):
+    return await conversation_crud.create_session(user_id=current_user.user_id, db=db, **payload.model_dump())
 
 
 @session_router.get("/sessions/{session_id}", response_model=conversation_models.SessionPublic)
-def get_full_session(session_id: str, db: SessionDep):
-    return conversation_crud.get_full_session(db, session_id)
+async def get_full_session(session_id: str, db: AsyncSessionDep):
+    return await conversation_crud.get_full_session(db, session_id)
+
+
+@session_router.get("/sessions/{session_id}/meta", response_model=conversation_models.SessionMetaPublic)
+async def get_session_meta(session_id: UUID, db: AsyncSessionDep, current_user: CurrentUser):
+    return await conversation_crud.get_session(db, session_id, current_user.user_id)
+
+
+@session_router.get("/sessions/{session_id}/messages", response_model=conversation_models.MessagesPage)
+async def get_session_messages(session_id: UUID, db: AsyncSessionDep, current_user: CurrentUser,
+                               limit: int = Query(default=50, ge=1, le=200), cursor: str | None = None,
+                               order: Literal["asc", "desc"] = "desc"):
+    _ = await conversation_crud.get_session(db, session_id, current_user.user_id)
+    messages, next_cursor = await conversation_crud.get_messages_page(db, session_id, limit, cursor, order)
+    return {"data": messages, "next_cursor": next_cursor}
 
 
 @session_router.delete("/sessions/{session_id}", response_model=Message)
-def delete_session(session_id: UUID, db: SessionDep) -> Any:
-    return conversation_crud.delete_session(db, session_id)
+async def delete_session(session_id: UUID, db: AsyncSessionDep) -> Any:
+    return await conversation_crud.delete_session(db, session_id)
 
 
 @session_router.get("/sessions", response_model=conversation_models.SessionsPublic)
-def get_all_sessions(current_user: CurrentUser, db: SessionDep, limit: int = 10):
-    return {"data": conversation_crud.get_all_sessions(current_user.user_id, db, limit)}
+async def get_all_sessions(current_user: CurrentUser, db: AsyncSessionDep, limit: int = 10):
+    return {"data": await conversation_crud.get_all_sessions(current_user.user_id, db, limit)}
 
 # from app.models.conversation_models import MessageData
 # @session_router.post("/sessions/{session_id}/messages")
@@ -45,7 +60,3 @@ def get_all_sessions(current_user: CurrentUser, db: SessionDep, limit: int = 10)
 #     db.refresh(new_message)
 #     return new_message
 
-# @session_router.post("/messages/{message_id}/retrieved_docs")
-# def attach_docs(message_id: str, docs: List[dict], db: SessionDep):
-#     conversation_crud.attach_retrieved_docs(db, message_id, docs)
-#     return {"status": "ok"}
@@ -0,0 +1,33 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from starlette import status
+
+from app.core.db import async_engine
+from app.services.warmup_service import warmup_state
+from app.utils.logger import logger
+
+router = APIRouter()
+
+
+@router.get("/healthz")
+async def healthz():
+    """Liveness: the process serves requests (no dependency checked)."""
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readyz():
+    """Readiness: warmup done and database reachable, otherwise 503 so no traffic is routed here."""
+    report = {"warmup": warmup_state.report()}
+    try:
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+        report["database"] = "ok"
+    except Exception as e:
+        logger.error(f"Readiness check: database unreachable: {e}")
+        report["database"] = "unreachable"
+
+    ready = warmup_state.ready and report["database"] == "ok"
+    return JSONResponse(content={"ready": ready, **report},
+                        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.db import get_pool_status
+from app.core.metrics import REGISTRY, CallbackMetric
+from app.core.security import password_hasher
+from app.services.email_service import email_queue
+
+router = APIRouter()
+
+# Resource pools and queues, read when scraped
+CallbackMetric("db_pool_connections", "DB pool connections by engine and state", ["engine", "state"],
+               lambda: {(engine, state): pool[state]
+                        for engine, pool in get_pool_status().items()
+                        for state in ("in_use", "checked_in", "overflow")})
+CallbackMetric("db_pool_checkout_timeouts_total", "DB pool checkouts that timed out", ["engine"],
+               lambda: {(engine,): pool["timeouts"] for engine, pool in get_pool_status().items()},
+               type="counter")
+CallbackMetric("password_hash_tasks", "Password hashing calls by state", ["state"],
+               lambda: {(state,): password_hasher.stats()[state] for state in ("queued", "running")})
+CallbackMetric("password_hash_rejected_total", "Password hashing calls rejected (queue full)", [],
+               lambda: {(): password_hasher.stats()["rejected"]}, type="counter")
+CallbackMetric("email_queue_size", "Outgoing emails waiting to be sent", [],
+               lambda: {(): email_queue.stats()["queued"]})
+CallbackMetric("emails_total", "Outgoing emails by outcome", ["status"],
+               lambda: {(status,): email_queue.stats()[status] for status in ("sent", "failed")}, type="counter")
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,18 +1,20 @@
-from typing import List
+import asyncio
+import os
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, File, HTTPException, Query, UploadFile
 from pydantic import BaseModel
 from starlette import status
 
-from app.core.db import SessionDep
+from app.core.db import AsyncSessionDep
+from app.core.security import CurrentUser
 from app.models.conversation_models import MessageData
 from app.services.embedding_service import load_and_chunk_documents
-from app.services.embedding_service import setup_vector_database
-from app.services.retriever_service import search_query_pipline
-from app.services.generator_service import ask_agent_v1
-from app.services.rag_service import run_complete_rag_pipeline
+from app.services.embedding_service import setup_vector_database, index_user_document, delete_user_collection
+from app.services.retriever_service import search_query_pipline, resolve_ef_search
 import app.services.conversation_crud as conversation_crud
 from app.core.config import settings as server_settings
+from app.core.metrics import stage_timer
 
 from app.utils.logger import logger
 
@@ -52,9 +54,85 @@ def index_documents():
 
 
 @router.post("/search", response_model=IndexSearchResults)
-def search(query: str):
+def search(query: str, top_k: int = Query(default=3, ge=1, le=50), profile: Optional[str] = None,
+           ef_search: Optional[int] = Query(default=None, ge=1, le=2000)):
+    """
+    Search the indexed chunks. `profile` ("fast", "balanced", "accurate", see SEARCH_PROFILES)
+    or an explicit `ef_search` trade recall for latency, the default profile otherwise.
+    """
     try:
-        return {"data": search_query_pipline(query)}
+        ef_search = resolve_ef_search(profile, ef_search)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    try:
+        return {"data": search_query_pipline(query, top_k=top_k, ef_search=ef_search)}
+    except Exception as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Service temporarily unavailable. Please try again later.",
+        )
+
+
+class UploadedDocument(BaseModel):
+    file_name: str
+    chunks: int
+
+
+class UploadResponse(BaseModel):
+    data: List[UploadedDocument]
+
+
+@router.post("/documents", response_model=UploadResponse, status_code=status.HTTP_201_CREATED)
+async def upload_documents(current_user: CurrentUser, files: List[UploadFile] = File(...)):
+    """
+    Upload UTF-8 text documents to the caller's private collection (a file uploaded again
+    replaces its previous version). They are searched with the shared corpus by
+    `/documents/search` and by the chat agent of the caller's sessions.
+    """
+    uploaded = []
+    for file in files:
+        file_name = os.path.basename(file.filename or "")
+        if not file_name:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Missing file name")
+        content = await file.read(server_settings.USER_UPLOAD_MAX_BYTES + 1)
+        if len(content) > server_settings.USER_UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"{file_name} is larger than {server_settings.USER_UPLOAD_MAX_BYTES} bytes")
+        try:
+            # chunking and embedding are CPU bound, off the event loop
+            chunks = await asyncio.to_thread(index_user_document, current_user.user_id, file_name, content)
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                detail=f"{file_name} is not a UTF-8 text file")
+        except Exception as e:
+            logger.error(str(e))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Service temporarily unavailable. Please try again later.",
+            )
+        uploaded.append({"file_name": file_name, "chunks": chunks})
+    return {"data": uploaded}
+
+
+@router.delete("/documents")
+def delete_documents(current_user: CurrentUser):
+    """Delete all the documents uploaded by the caller."""
+    if not delete_user_collection(current_user.user_id):
+        raise HTTPException(status_code=404, detail="No uploaded documents")
+    return {"response": "Uploaded documents deleted successfully"}
+
+
+@router.post("/documents/search", response_model=IndexSearchResults)
+def search_documents(query: str, current_user: CurrentUser, top_k: int = Query(default=3, ge=1, le=50),
+                     profile: Optional[str] = None, ef_search: Optional[int] = Query(default=None, ge=1, le=2000)):
+    """Search the shared corpus and the caller's uploads concurrently, results merged by similarity."""
+    try:
+        ef_search = resolve_ef_search(profile, ef_search)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    try:
+        return {"data": search_query_pipline(query, top_k=top_k, ef_search=ef_search, user_id=current_user.user_id)}
     except Exception as e:
         logger.error(str(e))
         raise HTTPException(
@@ -65,6 +143,9 @@ def search(query: str):
 
 @router.post("/ask", response_model=AskResponse)
 def ask(query: str):
+    # imported on first use: the generation services pull in llama_index, which slows down app startup
+    from app.services.rag_service import run_complete_rag_pipeline
+
     try:
         response = run_complete_rag_pipeline(query)
         return {"response": str(response)}
@@ -77,39 +158,48 @@ def ask(query: str):
 
 
 @router.post("/chat/{session_id}", response_model=AskResponse)
-async def chat_with_agent(query: str, session_id: str, db: SessionDep):
+async def chat_with_agent(query: str, session_id: str, db: AsyncSessionDep, current_user: CurrentUser):
+    """
+    Answer a message of one of the caller's chat sessions. The agent also searches the
+    caller's uploaded documents, so only the owner of a session can chat in it.
+    """
+    from app.services.generator_service import ask_agent_v1
+
     try:
         u_md = MessageData(
             role="user",
             additional_kwargs={},
             blocks=[{"block_type": "text", "text": query}],
         )
-        # Store user message in DB
-        _ = conversation_crud.add_message(db, session_id,
-                                          data=u_md.model_dump(),
-                                          tokens=None)
+        session = await conversation_crud.get_session(db, session_id, current_user.user_id)
+        # Messages of the turn are buffered and written in one batch once the agent answered
+        turn = conversation_crud.ChatTurn(db, session)
 
-        # Get the chat history after we store the new user message
-        session = conversation_crud.get_full_session(db, session_id)
+        # Get the chat history window, followed by the new user message
+        with stage_timer("history_load"):
+            history = await conversation_crud.get_chat_window(db, session_id,
+                                                              server_settings.CHAT_HISTORY_MAX_MESSAGES - 1)
+        history.append(turn.add_message(data=u_md.model_dump()))
 
         # Send the chat history to Agent
-        response = await ask_agent_v1(session, db)
+        response = await ask_agent_v1(turn, history)
 
         # Store agent response
-        conversation_crud.add_message(db, session_id, data=response.message.model_dump(), tokens=None)
+        turn.add_message(data=response.message.model_dump())
 
-        # Commit the transaction if the response succeeded
-        db.commit()  # db.refresh(new_message)
+        # Write the turn if the response succeeded
+        with stage_timer("db_write"):
+            await turn.commit()
 
         return {"response": str(response)}
     except HTTPException:
         # rollback the transaction if any errors happened
-        db.rollback()
+        await db.rollback()
         # Re-raise HTTPException so FastAPI can handle it properly
         raise
     except Exception as e:
         # rollback the transaction if any errors happened
-        db.rollback()
+        await db.rollback()
         logger.exception(f"Unexpected error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException
 
 from app.core.db import SessionDep
 from app.core.security import get_current_active_superuser, CurrentUser, verify_password, \
-    get_password_hash
+    get_password_hash, invalidate_cached_user
 from app.models.schemas_models import Message, UpdatePassword
 import app.services.user_crud as crud
 from app.models.user_models import UsersPublic, User, UserPublic, UserUpdateMe, UserRegister, \
@@ -38,16 +38,19 @@ def update_user_me(
     """
     if user_in.email:
         existing_user = crud.get_user_by_email(db=db, email=user_in.email)
-        if existing_user and existing_user.id != current_user.id:
+        if existing_user and existing_user.user_id != current_user.user_id:
             raise HTTPException(
                 status_code=409, detail="User with this email already exists"
             )
+    # current_user belongs to the async session of the auth dependency, update this session's copy
+    db_user = db.get(User, current_user.user_id)
     user_data = user_in.model_dump(exclude_unset=True)
-    current_user.sqlmodel_update(user_data)
-    db.add(current_user)
+    db_user.sqlmodel_update(user_data)
+    db.add(db_user)
     db.commit()
-    db.refresh(current_user)
-    return current_user
+    invalidate_cached_user(db_user.user_id)
+    db.refresh(db_user)
+    return db_user
 
 
 @router.patch("/me/password", response_model=Message)
@@ -64,9 +67,11 @@ def update_password_me(
     if not verify_password(body.current_password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect password")
     hashed_password = get_password_hash(body.new_password)
-    current_user.hashed_password = hashed_password
-    db.add(current_user)
+    db_user = db.get(User, current_user.user_id)
+    db_user.hashed_password = hashed_password
+    db.add(db_user)
     db.commit()
+    invalidate_cached_user(db_user.user_id)
     return Message(message="Password updated successfully")
 
 
@@ -79,7 +84,7 @@ def delete_user_me(db: SessionDep, current_user: CurrentUser) -> Any:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    return crud.delete_user(db=db, user=current_user)
+    return crud.delete_user(db=db, user=db.get(User, current_user.user_id))
 
 
 @router.get(
@@ -102,7 +107,7 @@ def read_user_by_id(
     Get a specific user by id.
     """
     user = db.get(User, user_id)
-    if user == current_user:
+    if user and user.user_id == current_user.user_id:
         return user
     if not current_user.is_superuser:
         raise HTTPException(
@@ -135,7 +140,7 @@ def update_user(
         )
     if user_in.email:
         existing_user = crud.get_user_by_email(db=db, email=user_in.email)
-        if existing_user and existing_user.id != user_id:
+        if existing_user and existing_user.user_id != user_id:
             raise HTTPException(
                 status_code=409, detail="User with this email already exists"
             )
@@ -153,7 +158,7 @@ def delete_user(
     user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if user == current_user:
+    if user.user_id == current_user.user_id:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
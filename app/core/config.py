@@ -51,8 +51,137 @@ class Settings(BaseSettings):
 
     EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 48
 
+    # bcrypt cost factor of new password hashes (2^rounds iterations), existing hashes keep theirs
+    BCRYPT_ROUNDS: int = 12
+    # Threads hashing / verifying passwords off the event loop, and max calls waiting for one
+    # (further calls are rejected with 503 instead of queueing up during a login burst)
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    # Seconds an authenticated user is served from the in-process cache instead of the DB,
+    # 0 disables the cache. Writes invalidate it in this process only: with several workers
+    # a change (e.g. deactivation) takes up to this long to reach the other ones
+    USER_CACHE_TTL_SECONDS: float = 30.0
+
     DATA_DIR: str = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "articles")
 
+    # Sentence-transformers model embedding the queries, same as the one of the Chroma collection
+    EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    # Chroma vector store and the chunking its collection was built with
+    VECTOR_DB_PATH: str = "vector_db/chroma"
+    COLLECTION_NAME: str = "wiki_articles_v1"
+    CHUNK_SIZE: int = 200
+    CHUNK_OVERLAP: int = 50
+
+    # HNSW index of the Chroma collections, used when a collection is created (Chroma keeps the
+    # parameters of existing collections). Overrides by collection name use Chroma's keys,
+    # e.g. {"wiki_articles_v1": {"max_neighbors": 32, "ef_construction": 200}}
+    HNSW_SPACE: str = "cosine"
+    HNSW_M: int = 16
+    HNSW_CONSTRUCTION_EF: int = 100
+    # ef_search of the index itself: the floor of every search, the profiles below raise it per request
+    HNSW_SEARCH_EF: int = 16
+    HNSW_BATCH_SIZE: int = 100
+    HNSW_SYNC_THRESHOLD: int = 1000
+    HNSW_COLLECTION_OVERRIDES: dict[str, dict] = {}
+    # ef_search of the search profiles selectable per request (latency vs recall), the profile used
+    # when none is given and the one of the chat agent's search tool
+    SEARCH_PROFILES: dict[str, int] = {"fast": 16, "balanced": 100, "accurate": 400}
+    SEARCH_DEFAULT_PROFILE: str = "balanced"
+    AGENT_SEARCH_PROFILE: str = "balanced"
+
+    # Sharded mode of the shared corpus: with more than one shard its chunks are hash-partitioned
+    # (by chunk id) over that many local processes, each with its own Chroma store next to
+    # VECTOR_DB_PATH, and every search is scattered to all of them. Each app worker starts its
+    # own shards on the same stores: run a single worker in this mode
+    VECTOR_SHARDS: int = 1
+
+    # Documents uploaded by a user go to a private collection (this prefix + user id), searched
+    # together with the shared COLLECTION_NAME corpus; max size of an uploaded file (bytes) and
+    # threads searching the collections of a query concurrently
+    USER_COLLECTION_PREFIX: str = "user_"
+    USER_UPLOAD_MAX_BYTES: int = 5 * 1024 * 1024
+    SEARCH_FANOUT_WORKERS: int = 8
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def INDEX_VERSION(self) -> str:
+        # chunk ids are only meaningful for the chunking they were produced with
+        return f"{self.COLLECTION_NAME}:{self.CHUNK_SIZE}:{self.CHUNK_OVERLAP}"
+
+    # Ollama server and the LLM it serves for the RAG pipeline, with its context window (in tokens)
+    OLLAMA_BASE_URL: str = "http://localhost:11434"
+    LLM_MODEL: str = "llama3.1:8b"
+    LLM_CONTEXT_WINDOW: int = 8000
+    # Hugging Face tokenizers matching the Ollama models, used for token accounting
+    LLM_TOKENIZERS: dict[str, str] = {
+        "llama3.1:8b": "unsloth/Meta-Llama-3.1-8B-Instruct",
+        "qwen3:8b": "Qwen/Qwen3-8B",
+    }
+
+    # Preload the models and the vector index when the app starts, /readyz only succeeds once done
+    WARMUP_ENABLED: bool = True
+    WARMUP_TIMEOUT_SECONDS: float = 600.0
+    # failed steps (e.g. Ollama or the vector store not up yet) are retried with exponential
+    # backoff (base delay, capped), until the warmup succeeds
+    WARMUP_RETRY_BACKOFF_SECONDS: float = 2.0
+    WARMUP_RETRY_MAX_DELAY_SECONDS: float = 60.0
+    # how long Ollama keeps the preloaded models in memory (Ollama `keep_alive` duration)
+    OLLAMA_KEEP_ALIVE: str = "30m"
+
+    # Tool-calling model used by the chat agent
+    AGENT_MODEL: str = "qwen3:8b"
+    # Max tokens of chat history replayed to the agent, and tokens kept free for its answer
+    AGENT_HISTORY_TOKEN_BUDGET: int = 4000
+    AGENT_RESPONSE_TOKEN_RESERVE: int = 1024
+    # Guards of the agent tool loop: max LLM rounds with tool calls and wall-clock deadline
+    AGENT_MAX_ITERATIONS: int = 4
+    AGENT_DEADLINE_SECONDS: float = 120.0
+    # Once the unsummarized history of a session passes this many tokens, older turns
+    # are condensed into a stored summary; the most recent turns are kept verbatim
+    SUMMARY_TRIGGER_TOKENS: int = 3000
+    SUMMARY_KEEP_RECENT_TURNS: int = 2
+    SUMMARY_MAX_TOKENS: int = 512
+    # Max messages loaded from DB for one agent turn (on top of the stored summary)
+    CHAT_HISTORY_MAX_MESSAGES: int = 200
+
+    # Max tokens of retrieved context packed into a prompt
+    CONTEXT_TOKEN_BUDGET: int = 1500
+    # Word-shingle Jaccard similarity above which two context blocks are near-duplicates
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8
+
+    # Postgres connection pools, per app worker. The sync engine serves the sync endpoints run
+    # on AnyIO worker threads, the async one the event loop (async endpoints, chat turns), whose
+    # requests mostly wait on the LLM rather than the DB. A worker opens at most
+    # DB_POOL_SIZE + DB_MAX_OVERFLOW + DB_ASYNC_POOL_SIZE + DB_ASYNC_MAX_OVERFLOW connections
+    # (35 by default): keep that times the number of workers under Postgres' max_connections
+    # (100 by default), further requests wait up to DB_POOL_TIMEOUT for a free connection
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_ASYNC_POOL_SIZE: int = 5
+    DB_ASYNC_MAX_OVERFLOW: int = 10
+    # seconds to wait for a free connection before failing the request
+    DB_POOL_TIMEOUT: float = 30.0
+    # seconds after which a connection is replaced, -1 to keep connections forever
+    DB_POOL_RECYCLE: int = 1800
+    # check connections with a ping on checkout (drops connections closed by the server)
+    DB_POOL_PRE_PING: bool = True
+
+    # Request tracing: traces slower than the threshold are kept in a ring buffer of this size
+    # (see /admin/traces), all traces are exported when an OTLP/HTTP endpoint is set
+    # (e.g. http://localhost:4318 for a local OpenTelemetry collector)
+    TRACE_ENABLED: bool = True
+    TRACE_SLOW_THRESHOLD_SECONDS: float = 1.0
+    TRACE_BUFFER_SIZE: int = 100
+    TRACE_OTLP_ENDPOINT: str | None = None
+
+    # Sampling profiler (see app/core/profiling.py): interval between samples of an on-demand
+    # request profile and number of profiles kept, and the continuous low-rate mode
+    PROFILE_SAMPLE_INTERVAL_SECONDS: float = 0.005
+    PROFILE_BUFFER_SIZE: int = 20
+    PROFILE_CONTINUOUS_ENABLED: bool = False
+    PROFILE_CONTINUOUS_INTERVAL_SECONDS: float = 0.1
+
     SMTP_TLS: bool
     SMTP_SSL: bool
     SMTP_PORT: int
@@ -62,6 +191,12 @@ class Settings(BaseSettings):
     EMAILS_FROM_EMAIL: EmailStr
     EMAILS_FROM_NAME: str
 
+    # Outgoing emails are sent by a background worker: max emails sent over one SMTP
+    # connection, and delivery attempts with exponential backoff (base delay in seconds)
+    EMAIL_BATCH_SIZE: int = 20
+    EMAIL_MAX_ATTEMPTS: int = 5
+    EMAIL_RETRY_BACKOFF_SECONDS: float = 2.0
+
     @model_validator(mode="after")
     def _set_default_emails_from(self) -> Self:
         if not self.EMAILS_FROM_NAME:
@@ -1,7 +1,13 @@
 # database.py
+import threading
+import time
+from collections import deque
+
 from fastapi import Depends
 from typing import Annotated, AsyncGenerator
 
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel import create_engine, Session, SQLModel
@@ -17,8 +23,93 @@ ASYN_DATABASE_URI = str(server_settings.SQLALCHEMY_ASYN_DATABASE_URI)
 FIRST_SUPERUSER = server_settings.FIRST_SUPERUSER
 FIRST_SUPERUSER_PASSWORD = server_settings.FIRST_SUPERUSER_PASSWORD
 
+
+
+class PoolStats:
+    """Checkout counters of a connection pool, shared by the threads / tasks using it."""
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # latest checkout waits, for percentiles
+        self._recent = deque(maxlen=window)
+
+    def record(self, wait: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self._recent.append(wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            checkouts, timeouts = self.checkouts, self.timeouts
+            wait_total, wait_max = self.wait_total, self.wait_max
+
+        def pct(q: float) -> float:
+            return recent[min(len(recent) - 1, int(q * len(recent)))] * 1000 if recent else 0.0
+
+        return {
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "checkout_ms": {
+                "mean": wait_total / checkouts * 1000 if checkouts else 0.0,
+                "p50": pct(0.50),
+                "p95": pct(0.95),
+                "p99": pct(0.99),
+                "max": wait_max * 1000,
+            },
+        }
+
+
+# keyed by engine, kept across `pool.recreate()` (which builds a new pool instance)
+pool_stats: dict[str, PoolStats] = {"sync": PoolStats(), "async": PoolStats()}
+
+
+class _InstrumentedPoolMixin:
+    """Time each checkout (queue wait, new connection and pre-ping) and count timeouts."""
+    stats_key: str
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_stats[self.stats_key].record(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats[self.stats_key].record(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    stats_key = "sync"
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    stats_key = "async"
+
+
+# sized per engine, see the DB_* settings
+POOL_SIZES = {
+    "sync": dict(pool_size=server_settings.DB_POOL_SIZE, max_overflow=server_settings.DB_MAX_OVERFLOW),
+    "async": dict(pool_size=server_settings.DB_ASYNC_POOL_SIZE, max_overflow=server_settings.DB_ASYNC_MAX_OVERFLOW),
+}
+POOL_OPTIONS = dict(
+    pool_timeout=server_settings.DB_POOL_TIMEOUT,
+    pool_recycle=server_settings.DB_POOL_RECYCLE,
+    pool_pre_ping=server_settings.DB_POOL_PRE_PING,
+)
+
 # psycopg3 works directly with SQLModel's create_engine
-engine = create_engine(SYN_DATABASE_URI)  # echo=False
+engine = create_engine(SYN_DATABASE_URI, poolclass=InstrumentedQueuePool, **POOL_SIZES["sync"],
+                       **POOL_OPTIONS)  # echo=False
 
 
 # get DB session
@@ -38,6 +129,9 @@ async_engine = create_async_engine(
     ASYN_DATABASE_URI,  # Async connection string
     # echo=True,  # Optional: Set to False in production
     future=True,
+    poolclass=InstrumentedAsyncQueuePool,
+    **POOL_SIZES["async"],
+    **POOL_OPTIONS,
 )
 
 # Step 2: Set up async session
@@ -54,7 +148,24 @@ async def _get_async_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+def get_pool_status() -> dict:
+    """Current occupancy and checkout statistics of both connection pools."""
+    status = {}
+    for key, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        status[key] = {
+            "size": pool.size(),
+            "max_overflow": POOL_SIZES[key]["max_overflow"],
+            "checked_in": pool.checkedin(),
+            "in_use": pool.checkedout(),
+            # connections opened beyond `size`; negative while the pool is still filling up
+            "overflow": pool.overflow(),
+            **pool_stats[key].snapshot(),
+        }
+    return status
+
+
 # Wrap _get_async_session with Depends on FastAPI to keep type checking happy
 get_async_session = Depends(_get_async_session)
 
 SessionDep = Annotated[Session, Depends(get_db_session)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(_get_async_session)]
@@ -0,0 +1,170 @@
+"""
+Lightweight in-process metrics served in the Prometheus text exposition format
+
+Counters and histograms keep their series in dicts keyed by label values, recording is
+a dict lookup, a bisect and a lock (no allocation once a series exists).
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Route template of the request being served, used as the `endpoint` label of the stage metrics
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in values]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (+Inf last), sum]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        lines = self.header()
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Gauge (or counter kept elsewhere) read on scrape from a function returning {label values tuple: value}."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str], callback: Callable[[], dict],
+                 type: str = "gauge"):
+        self.type = type
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {value}"
+                                for key, value in self.callback().items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:  # a failing gauge callback must not break the scrape
+                lines.append(f"# {metric.name} collection failed: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ========================================
+# Application metrics
+# ========================================
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint", ["method", "endpoint", "status"])
+stage_duration = Histogram(
+    "rag_stage_duration_seconds", "Latency of the RAG / agent pipeline stages", ["stage", "endpoint", "model"])
+cache_hits = Counter("rag_cache_hits_total", "Cache hits by cache", ["cache"])
+cache_misses = Counter("rag_cache_misses_total", "Cache misses by cache", ["cache"])
+tool_calls = Counter("agent_tool_calls_total", "Agent tool calls by tool and outcome", ["tool", "status"])
+llm_tokens = Counter("llm_tokens_total", "LLM tokens by model and direction (in = prompt, out = completion)",
+                     ["model", "direction"])
+
+
+@contextmanager
+def stage_timer(stage: str, model: str = ""):
+    """Time a pipeline stage into `rag_stage_duration_seconds`, labeled with the current endpoint."""
+    with stage_duration.time(stage=stage, endpoint=current_endpoint.get(), model=model):
+        yield
+
+
+def record_llm_usage(model: str, response) -> None:
+    """Count the prompt / completion tokens reported by Ollama in a llama_index chat response."""
+    raw = getattr(response, "raw", None) or {}
+    if raw.get("prompt_eval_count"):
+        llm_tokens.inc(raw["prompt_eval_count"], model=model, direction="in")
+    if raw.get("eval_count"):
+        llm_tokens.inc(raw["eval_count"], model=model, direction="out")
@@ -0,0 +1,254 @@
+"""
+Sampling profiler usable in production: the Python stacks of the worker's threads are
+read with `sys._current_frames()` from a background thread (no tracing hooks, the
+profiled code runs at full speed) and aggregated as folded stacks, the input format of
+flame graph tools (flamegraph.pl, speedscope, inferno).
+
+- On demand: a superuser sends `X-Profile: 1` with a request, the response carries an
+  `X-Profile-Id` to fetch from `/admin/profiles/{profile_id}`
+- Continuous: a low-rate sampler aggregating stacks until read (see `/admin/profiles/continuous`)
+"""
+
+import html
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from typing import Dict, Optional
+
+from app.core.config import settings as server_settings
+from app.utils.logger import logger
+
+# Leaf frames of a thread blocked waiting (event loop polling, idle pool workers, locks),
+# their samples are dropped: a profile shows where the worker spends CPU
+IDLE_FRAMES = {
+    ("selectors", "select"),
+    ("threading", "wait"),
+    ("threading", "_wait_for_tstate_lock"),
+    ("queue", "get"),
+    ("concurrent.futures.thread", "_worker"),
+    ("anyio._backends._asyncio", "run"),
+    ("socketserver", "serve_forever"),
+}
+
+# Parts of the request path, a sample is counted for each one found in its stack
+COMPONENTS = {
+    "embedding": ("sentence_transformers", "torch", "app.services.embedding_service"),
+    "chroma": ("chromadb",),
+    "prompt": ("app.services.context_service", "app.utils.token_utils", "app.services.history_service"),
+    "llm": ("llama_index", "ollama", "httpx"),
+    "db": ("sqlalchemy", "asyncpg", "psycopg"),
+}
+
+
+def _frame_label(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+class Profile:
+    """Folded stacks of one profiling run."""
+
+    def __init__(self, name: str):
+        self.profile_id = os.urandom(8).hex()
+        self.name = name
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.components: Counter = Counter()
+
+    def add(self, stack: str, components):
+        self.samples += 1
+        self.stacks[stack] += 1
+        self.components.update(components)
+
+    def summary(self) -> dict:
+        return {"profile_id": self.profile_id, "name": self.name, "started_at": self.started_at,
+                "duration_s": round(self.duration, 3), "samples": self.samples,
+                "components": dict(self.components.most_common())}
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+class StackSampler:
+    """Background thread adding the stacks of the other threads to a `Profile` every `interval` seconds."""
+
+    def __init__(self, profile: Profile, interval: float, max_depth: int = 128):
+        self.profile = profile
+        self.interval = interval
+        self.max_depth = max_depth
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{profile.profile_id}", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> Profile:
+        self._stop.set()
+        self._thread.join()
+        self.profile.duration = time.perf_counter() - self._started
+        return self.profile
+
+    def snapshot(self) -> Profile:
+        """Copy of the stacks sampled so far, safe to read while sampling goes on."""
+        with self._lock:
+            copy = Profile(self.profile.name)
+            copy.profile_id, copy.started_at = self.profile.profile_id, self.profile.started_at
+            copy.samples = self.profile.samples
+            copy.stacks, copy.components = Counter(self.profile.stacks), Counter(self.profile.components)
+        copy.duration = time.perf_counter() - self._started
+        return copy
+
+    def swap(self, profile: Profile) -> Profile:
+        """Continue sampling into a new profile and return the current one."""
+        with self._lock:
+            previous, self.profile = self.profile, profile
+        previous.duration = time.perf_counter() - self._started
+        self._started = time.perf_counter()
+        return previous
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or names.get(thread_id, "").startswith("profiler-"):
+                continue
+            if (frame.f_globals.get("__name__"), frame.f_code.co_name) in IDLE_FRAMES:
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, str(thread_id)))
+            labels.reverse()
+            components = [component for component, modules in COMPONENTS.items()
+                          if any(label.startswith(modules) for label in labels)]
+            with self._lock:
+                self.profile.add(";".join(labels), components)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                logger.warning(f"Profiler sample failed: {e}")
+
+
+# Latest on-demand profiles by id
+_profiles: "OrderedDict[str, Profile]" = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def start_request_profile(name: str) -> StackSampler:
+    # every thread of the worker is sampled: concurrent requests show up in the profile too
+    return StackSampler(Profile(name), server_settings.PROFILE_SAMPLE_INTERVAL_SECONDS).start()
+
+
+def store_profile(profile: Profile) -> None:
+    with _profiles_lock:
+        _profiles[profile.profile_id] = profile
+        while len(_profiles) > server_settings.PROFILE_BUFFER_SIZE:
+            _profiles.popitem(last=False)
+
+
+def list_profiles() -> list:
+    with _profiles_lock:
+        return [profile.summary() for profile in reversed(_profiles.values())]
+
+
+def get_profile(profile_id: str) -> Optional[Profile]:
+    return _profiles.get(profile_id)
+
+
+class ContinuousProfiler:
+    """Low-rate sampler of the whole worker, started and stopped at runtime."""
+
+    def __init__(self):
+        self._sampler: Optional[StackSampler] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._sampler is not None
+
+    def start(self, interval: float = None) -> bool:
+        with self._lock:
+            if self._sampler is not None:
+                return False
+            interval = interval or server_settings.PROFILE_CONTINUOUS_INTERVAL_SECONDS
+            self._sampler = StackSampler(Profile("continuous"), interval).start()
+            logger.info(f"Continuous profiling started (every {interval * 1000:.0f} ms)")
+            return True
+
+    def stop(self) -> Optional[Profile]:
+        with self._lock:
+            sampler, self._sampler = self._sampler, None
+        if sampler is None:
+            return None
+        logger.info("Continuous profiling stopped")
+        return sampler.stop()
+
+    def snapshot(self, reset: bool = False) -> Optional[Profile]:
+        """Stacks aggregated so far; with `reset`, aggregation restarts from zero."""
+        sampler = self._sampler
+        if sampler is None:
+            return None
+        return sampler.swap(Profile("continuous")) if reset else sampler.snapshot()
+
+
+continuous_profiler = ContinuousProfiler()
+
+
+# ========================================
+# Flame graph rendering
+# ========================================
+
+def render_flamegraph(profile: Profile, width: int = 1200, frame_height: int = 16, min_width: float = 0.5) -> str:
+    """Render the folded stacks of a profile as a standalone SVG flame graph."""
+    root: Dict = {"count": 0, "children": {}}
+    for stack, count in profile.stacks.items():
+        node = root
+        node["count"] += count
+        for label in stack.split(";"):
+            node = node["children"].setdefault(label, {"count": 0, "children": {}})
+            node["count"] += count
+
+    total = root["count"] or 1
+    rects = []
+    depth_max = 0
+
+    def walk(node: Dict, x: float, depth: int):
+        nonlocal depth_max
+        for label, child in sorted(node["children"].items()):
+            w = child["count"] / total * width
+            if w >= min_width:
+                depth_max = max(depth_max, depth)
+                rects.append((label, child["count"], x, depth, w))
+                walk(child, x, depth + 1)
+            x += w
+
+    walk(root, 0.0, 0)
+    height = (depth_max + 1) * frame_height + 24
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" '
+             f'font-size="11">',
+             f'<text x="4" y="14">{html.escape(profile.name)}: {profile.samples} samples, '
+             f'{profile.duration:.2f}s</text>']
+    for label, count, x, depth, w in rects:
+        y = height - (depth + 1) * frame_height
+        # warm colours, stable per function
+        hue = zlib.crc32(label.split(":")[-1].encode()) % 60
+        text = html.escape(label)
+        chars = int(w / 7)
+        parts.append(
+            f'<g><title>{text} ({count} samples, {count / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{frame_height - 1}" fill="hsl({hue},80%,60%)"/>'
+            + (f'<text x="{x + 2:.1f}" y="{y + frame_height - 4}">{text[:chars]}</text>' if chars > 3 else "")
+            + '</g>')
+    parts.append("</svg>")
+    return "\n".join(parts)
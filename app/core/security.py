@@ -1,5 +1,10 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from passlib.context import CryptContext
@@ -14,16 +19,48 @@ from .config import settings as server_settings
 
 from uuid import UUID
 
-from .db import SessionDep
+from .db import AsyncSessionDep, async_session
+from .metrics import cache_hits, cache_misses
 
 SECRET_KEY = server_settings.SECRET_KEY
 ACCESS_TOKEN_EXPIRE_MINUTES = server_settings.ACCESS_TOKEN_EXPIRE_MINUTES
 ALGORITHM = "HS256"
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=server_settings.BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 
+# Authenticated users by id: (expiry, snapshot of the row), see `get_current_user`
+_user_cache: dict[UUID, tuple[float, dict]] = {}
+USER_CACHE_MAX_ENTRIES = 10_000
+
+
+def _cached_user(user_id: UUID) -> User | None:
+    entry = _user_cache.get(user_id)
+    if entry is None:
+        return None
+    expires_at, snapshot = entry
+    if expires_at < time.monotonic():
+        _user_cache.pop(user_id, None)
+        return None
+    # a fresh detached instance per request, callers may modify it
+    return User(**snapshot)
+
+
+def _cache_user(user: User) -> None:
+    if server_settings.USER_CACHE_TTL_SECONDS <= 0:
+        return
+    if len(_user_cache) >= USER_CACHE_MAX_ENTRIES:
+        # drop the oldest entry (dicts keep insertion order)
+        _user_cache.pop(next(iter(_user_cache)), None)
+    _user_cache[user.user_id] = (time.monotonic() + server_settings.USER_CACHE_TTL_SECONDS, user.model_dump())
+
+
+def invalidate_cached_user(user_id: UUID) -> None:
+    """Drop a user from the authentication cache, to call whenever the user row changes."""
+    _user_cache.pop(user_id, None)
+
+
 # create user token
 def create_access_token(data: dict, expires_delta: timedelta):
     expire = datetime.now(timezone.utc) + expires_delta
@@ -32,17 +69,97 @@ def create_access_token(data: dict, expires_delta: timedelta):
     return encoded_jwt
 
 
-# hashing user password
+class PasswordHasher:
+    """
+    Bounded thread pool running the bcrypt work (CPU-bound, tens to hundreds of ms per call).
+
+    bcrypt releases the GIL while hashing, so the event loop and the other workers keep
+    running; the pool size caps the CPU a login burst can take, the pending limit its queue.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.pending = 0  # submitted and not finished (queued + running)
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.run_total = 0.0
+
+    def submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many password checks in progress, please try again later.",
+                )
+            self.pending += 1
+        return self._executor.submit(self._run, time.perf_counter(), fn, *args)
+
+    def _run(self, submitted: float, fn, *args):
+        started = time.perf_counter()
+        with self._lock:
+            self.running += 1
+            self.queue_wait_total += started - submitted
+            self.queue_wait_max = max(self.queue_wait_max, started - submitted)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.pending -= 1
+                self.completed += 1
+                self.run_total += time.perf_counter() - started
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = self.completed
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "queued": self.pending - self.running,
+                "running": self.running,
+                "completed": completed,
+                "rejected": self.rejected,
+                "queue_wait_ms": {
+                    "mean": self.queue_wait_total / completed * 1000 if completed else 0.0,
+                    "max": self.queue_wait_max * 1000,
+                },
+                "run_ms_mean": self.run_total / completed * 1000 if completed else 0.0,
+                "bcrypt_rounds": server_settings.BCRYPT_ROUNDS,
+            }
+
+
+password_hasher = PasswordHasher(server_settings.PASSWORD_HASH_WORKERS, server_settings.PASSWORD_HASH_MAX_PENDING)
+
+
+# hashing user password (sync endpoints, already off the event loop, still share the bounded pool)
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_hasher.submit(pwd_context.hash, password).result()
 
 
 # verify user password
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.submit(pwd_context.verify, plain_password, hashed_password).result()
+
+
+# async variants for `async def` endpoints, awaiting without blocking the event loop
+async def aget_password_hash(password):
+    return await asyncio.wrap_future(password_hasher.submit(pwd_context.hash, password))
 
 
-async def get_current_user(db: SessionDep, token: str = Depends(oauth2_scheme)):
+async def averify_password(plain_password, hashed_password):
+    return await asyncio.wrap_future(password_hasher.submit(pwd_context.verify, plain_password, hashed_password))
+
+
+async def get_current_user(db: AsyncSessionDep, token: str = Depends(oauth2_scheme)):
+    # FastAPI resolves this dependency once per request (router dependency and `CurrentUser` included),
+    # across requests the user is served from a short-lived cache instead of a DB round-trip
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -57,9 +174,15 @@ async def get_current_user(db: SessionDep, token: str = Depends(oauth2_scheme)):
     except (InvalidTokenError, ValidationError):
         raise credentials_exception
 
-    user = db.query(User).filter((User.user_id == token_data.user_id)).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user = _cached_user(token_data.user_id)
+    if user is None:
+        cache_misses.inc(cache="user")
+        user = await db.get(User, token_data.user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        _cache_user(user)
+    else:
+        cache_hits.inc(cache="user")
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return user
@@ -76,6 +199,14 @@ def get_current_active_superuser(current_user: CurrentUser) -> User:
     return current_user
 
 
+async def get_superuser_from_request(request: Request) -> User:
+    """Same checks as the `get_current_active_superuser` dependency, for code running outside of a route."""
+    token = await oauth2_scheme(request)
+    async with async_session() as db:
+        user = await get_current_user(db, token)
+    return get_current_active_superuser(user)
+
+
 def generate_password_reset_token(email: EmailStr) -> str:
     delta = timedelta(hours=server_settings.EMAIL_RESET_TOKEN_EXPIRE_HOURS)
     now = datetime.now(timezone.utc)
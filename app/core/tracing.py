@@ -0,0 +1,255 @@
+"""
+Lightweight request tracing: spans propagated with contextvars through the request's
+coroutines and worker threads, recent slow traces kept in memory and optionally exported
+to an OTLP/HTTP collector (JSON encoding, e.g. an OpenTelemetry collector on :4318)
+"""
+
+import functools
+import inspect
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings as server_settings
+from app.utils.logger import logger
+
+
+@dataclass
+class Span:
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    start_ns: int
+    end_ns: Optional[int] = None
+    attributes: Dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {"span_id": self.span_id, "parent_id": self.parent_id, "name": self.name,
+                "start_ns": self.start_ns, "duration_ms": round(self.duration * 1000, 3),
+                "attributes": self.attributes, "error": self.error}
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    spans: List[Span] = field(default_factory=list)
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def summary(self) -> dict:
+        return {"trace_id": self.trace_id, "name": self.root.name, "start_ns": self.root.start_ns,
+                "duration_ms": round(self.root.duration * 1000, 3), "spans": len(self.spans),
+                "error": self.root.error}
+
+    def to_dict(self) -> dict:
+        return {**self.summary(), "spans": [span.to_dict() for span in self.spans]}
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+# Most recent traces slower than TRACE_SLOW_THRESHOLD_SECONDS
+slow_traces: deque = deque(maxlen=server_settings.TRACE_BUFFER_SIZE)
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a child span of the current one; a no-op outside of a traced request."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(trace.trace_id, _new_id(8), parent.span_id if parent else None, name, time.time_ns(),
+                   attributes=attributes)
+    # appended from coroutines and worker threads of the request, list.append is atomic
+    trace.spans.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = repr(e)
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator recording a span around each call of a sync or async function."""
+
+    def decorator(fn):
+        span_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def parse_traceparent(header: Optional[str]) -> tuple:
+    """(trace id, parent span id) of a W3C `traceparent` header, or (None, None)."""
+    try:
+        version, trace_id, parent_id, _ = header.split("-")
+        if len(trace_id) == 32 and len(parent_id) == 16 and int(trace_id, 16) and int(parent_id, 16):
+            return trace_id, parent_id
+    except (AttributeError, ValueError):
+        pass
+    return None, None
+
+
+@contextmanager
+def start_trace(name: str, traceparent: Optional[str] = None, **attributes):
+    """Root span of a request; once finished the trace is kept if slow and exported if configured."""
+    trace_id, remote_parent = parse_traceparent(traceparent)
+    trace = Trace(trace_id or _new_id(16))
+    root = Span(trace.trace_id, _new_id(8), remote_parent, name, time.time_ns(), attributes=attributes)
+    trace.spans.append(root)
+    trace_token, span_token = _current_trace.set(trace), _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = repr(e)
+        raise
+    finally:
+        root.end_ns = time.time_ns()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        if root.duration >= server_settings.TRACE_SLOW_THRESHOLD_SECONDS:
+            slow_traces.append(trace)
+        if exporter is not None:
+            exporter.submit(trace)
+
+
+def find_trace(trace_id: str) -> Optional[Trace]:
+    return next((trace for trace in slow_traces if trace.trace_id == trace_id), None)
+
+
+# ========================================
+# OTLP/HTTP export
+# ========================================
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(span: Span) -> dict:
+    otlp = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns or time.time_ns()),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+class OTLPExporter:
+    """Send finished traces to an OTLP/HTTP collector from a background thread, in batches."""
+
+    def __init__(self, endpoint: str, service_name: str, max_queue: int = 1000, batch_size: int = 50):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        threading.Thread(target=self._run, name="otlp-exporter", daemon=True).start()
+
+    def submit(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            # never slow down requests because the collector is slow or down
+            self.dropped += 1
+
+    def _run(self):
+        with httpx.Client(timeout=10.0) as client:
+            while True:
+                traces = [self._queue.get()]
+                while len(traces) < self.batch_size and not self._queue.empty():
+                    traces.append(self._queue.get_nowait())
+                payload = {"resourceSpans": [{
+                    "resource": {"attributes": [{"key": "service.name",
+                                                 "value": {"stringValue": self.service_name}}]},
+                    "scopeSpans": [{"scope": {"name": "app.core.tracing"},
+                                    "spans": [_otlp_span(s) for trace in traces for s in trace.spans]}],
+                }]}
+                try:
+                    client.post(self.url, json=payload).raise_for_status()
+                except Exception as e:
+                    logger.warning(f"OTLP export of {len(traces)} traces failed: {e}")
+
+
+exporter = OTLPExporter(server_settings.TRACE_OTLP_ENDPOINT, server_settings.PROJECT_NAME) \
+    if server_settings.TRACE_OTLP_ENDPOINT else None
+
+
+def annotate_llm_span(llm_span: Optional[Span], response) -> None:
+    """Add Ollama's own timings to an LLM call span: the rest of the call is queueing / transfer."""
+    raw = getattr(response, "raw", None) or {}
+    if llm_span is None or not raw.get("total_duration"):
+        return
+    total = raw["total_duration"] / 1e9
+    llm_span.set(**{
+        "llm.load_s": round(raw.get("load_duration", 0) / 1e9, 3),
+        "llm.prompt_eval_s": round(raw.get("prompt_eval_duration", 0) / 1e9, 3),
+        "llm.eval_s": round(raw.get("eval_duration", 0) / 1e9, 3),
+        "llm.prompt_tokens": raw.get("prompt_eval_count", 0),
+        "llm.completion_tokens": raw.get("eval_count", 0),
+        # time not spent in the model (waiting for a free Ollama slot, HTTP)
+        "llm.queue_s": round(max(0.0, (time.time_ns() - llm_span.start_ns) / 1e9 - total), 3),
+    })
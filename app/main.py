@@ -1,4 +1,9 @@
-from fastapi import FastAPI
+import asyncio
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
 
 from app.core.db import init_db, engine
 from app.core.config import settings as server_settings
@@ -8,6 +13,16 @@ from app.controllers.conversation_controller import session_router
 from app.controllers.rag_controller_v1 import router as rag_router_v1
 from app.controllers.auth_controller import router as auth_router
 from app.controllers.users_controller import router as users_router
+from app.controllers.admin_controller import router as admin_router
+from app.controllers.health_controller import router as health_router
+from app.controllers.metrics_controller import router as metrics_router
+from app.core.metrics import http_request_duration, current_endpoint
+from app.core.tracing import start_trace
+from app.core.profiling import start_request_profile, store_profile, continuous_profiler
+from app.core.security import get_superuser_from_request
+from app.services.email_service import email_queue
+from app.services.shard_service import stop_shards
+from app.services.warmup_service import warm_up, warmup_state
 
 from starlette.middleware.cors import CORSMiddleware
 
@@ -27,6 +42,58 @@ app.include_router(auth_router, prefix="/auth", tags=["Auth"])
 app.include_router(users_router, prefix="/users", tags=["users"])
 app.include_router(session_router, tags=["Sessions | Conversations"])
 app.include_router(rag_router_v1, prefix="/v1", tags=["Rag V1: Index, Search, Ask, Chat"])
+app.include_router(admin_router, prefix="/admin", tags=["Admin"])
+app.include_router(health_router, tags=["Health"])
+app.include_router(metrics_router, tags=["Health"])
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # label with the route template (bounded cardinality), not the raw path
+    endpoint = "unmatched"
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            endpoint = route.path
+            break
+    token = current_endpoint.set(endpoint)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        if not server_settings.TRACE_ENABLED:
+            response = await call_next(request)
+        else:
+            with start_trace(f"{request.method} {endpoint}", traceparent=request.headers.get("traceparent"),
+                             **{"http.method": request.method, "http.route": endpoint}) as root:
+                response = await call_next(request)
+                root.set(**{"http.status_code": response.status_code})
+            response.headers["X-Trace-Id"] = root.trace_id
+        status_code = response.status_code
+        return response
+    finally:
+        http_request_duration.observe(time.perf_counter() - started, method=request.method, endpoint=endpoint,
+                                      status=status_code)
+        current_endpoint.reset(token)
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    # opt-in per request, for superusers only: sampling every thread costs CPU
+    if request.headers.get("X-Profile") not in ("1", "true"):
+        return await call_next(request)
+    try:
+        await get_superuser_from_request(request)
+    except HTTPException as e:
+        return JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+
+    sampler = start_request_profile(f"{request.method} {request.url.path}")
+    try:
+        response = await call_next(request)
+    finally:
+        profile = sampler.stop()
+        store_profile(profile)
+    response.headers["X-Profile-Id"] = profile.profile_id
+    return response
 
 from app.services.user_crud import create_user
 from app.models.user_models import User, UserCreate
@@ -66,6 +133,29 @@ def on_startup() -> None:
     logger.info("Startup complete.")
 
 
+@app.on_event("startup")
+async def start_background_workers() -> None:
+    await email_queue.start()
+    if server_settings.PROFILE_CONTINUOUS_ENABLED:
+        continuous_profiler.start()
+    if server_settings.WARMUP_ENABLED:
+        # in the background: the app answers /healthz meanwhile, /readyz once warm
+        app.state.warmup_task = asyncio.create_task(warm_up())
+    else:
+        warmup_state.status = "ready"
+
+
+@app.on_event("shutdown")
+async def stop_background_workers() -> None:
+    await email_queue.stop()
+    continuous_profiler.stop()
+    warmup_task = getattr(app.state, "warmup_task", None)
+    if warmup_task is not None:
+        # still retrying if a dependency never came up
+        warmup_task.cancel()
+    stop_shards()
+
+
 @app.get("/")
 async def root():
     return {"response": "Server is running. Get /docs to see the endpoints."}
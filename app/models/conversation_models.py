@@ -3,9 +3,9 @@ from datetime import datetime, timezone
 from typing import Optional, List
 from uuid import UUID, uuid4
 
-from sqlalchemy import DateTime
+from sqlalchemy import DateTime, Index, UniqueConstraint, text
 from sqlmodel import SQLModel, Field, Relationship, Column
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy.dialects.postgresql import JSONB
 
 
 class SessionBase(SQLModel):
@@ -16,16 +16,19 @@ class SessionCreate(SessionBase):
     pass
 
 
-class SessionPublic(SessionBase):
+class SessionMetaPublic(SessionBase):
     session_id: UUID
     user_id: UUID
     created_at: datetime
     last_active_at: datetime
+
+
+class SessionPublic(SessionMetaPublic):
     messages: List["MessagePublic"] = []
 
 
 class SessionsPublic(SQLModel):
-    data: list[SessionPublic]
+    data: list[SessionMetaPublic]
 
 
 class Session(SessionBase, table=True):
@@ -36,8 +39,14 @@ class Session(SessionBase, table=True):
     last_active_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc),
                                      sa_column=Column(DateTime(timezone=True)))
 
+    __table_args__ = (
+        # session listing of a user, newest first (read with a backward index scan)
+        Index("ix_session_user_id_created_at", "user_id", "created_at"),
+    )
+
     user: "User" = Relationship(back_populates="sessions")
-    messages: list["Message"] = Relationship(back_populates="session", sa_relationship_kwargs={
+    # passive_deletes: messages are removed by the FK "ON DELETE CASCADE", not loaded to be deleted one by one
+    messages: list["Message"] = Relationship(back_populates="session", passive_deletes=True, sa_relationship_kwargs={
         "order_by": "Message.created_at"
     })  # cascade_delete=True,
 
@@ -56,6 +65,10 @@ class Role(str, Enum):
     model = "model"
 
 
+# Key of `MessageData.additional_kwargs` marking a stored conversation summary
+SUMMARY_KEY = "summary"
+
+
 class MessageData(SQLModel):
     role: Role
     blocks: list[dict]
@@ -63,7 +76,7 @@ class MessageData(SQLModel):
 
 
 class MessageBase(SQLModel):
-    data: dict = Field(sa_column=Column(JSON))
+    data: dict = Field(sa_column=Column(JSONB))
     tokens: Optional[int] = None
 
 
@@ -72,10 +85,32 @@ class MessageCreate(SQLModel):
     session_id: UUID
 
 
+class RetrievedDocPublic(SQLModel):
+    retrieved_doc_id: UUID
+    chunk_id: str
+    source_hash: str
+    title: Optional[str] = None
+    source: Optional[str] = None
+    snippet: str
+
+
+class MessageRetrievedDocPublic(SQLModel):
+    rank: int
+    score: Optional[float] = None
+    retrieved_doc: RetrievedDocPublic
+
+
 class MessagePublic(MessageBase):
     message_id: UUID
     session_id: UUID
     created_at: datetime
+    retrieved_docs: List[MessageRetrievedDocPublic] = []
+
+
+class MessagesPage(SQLModel):
+    data: list[MessagePublic]
+    # opaque keyset cursor to pass back for the next page, None on the last page
+    next_cursor: Optional[str] = None
 
 
 class Message(MessageBase, table=True):
@@ -84,31 +119,46 @@ class Message(MessageBase, table=True):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc),
                                  sa_column=Column(DateTime(timezone=True)))
 
+    __table_args__ = (
+        # history loads and keyset pagination of a session, ordered on (created_at, message_id)
+        Index("ix_message_session_id_created_at", "session_id", "created_at", "message_id"),
+        # latest summary of a session, see `conversation_crud.get_chat_window`
+        Index("ix_message_session_id_summary", "session_id", "created_at", "message_id",
+              postgresql_where=text(f"((data -> 'additional_kwargs') -> '{SUMMARY_KEY}') IS NOT NULL")),
+    )
+
     session: Session = Relationship(back_populates="messages")
-    # retrieved_docs: list["MessageRetrievedDoc"] = Relationship(back_populates="message", ) # cascade_delete=True
-
-# class RetrievedDoc(SQLModel, table=True):
-#     retrieved_doc_id: UUID = Field(default_factory=uuid4, primary_key=True)
-#     source_doc_id: str = None
-#     title: Optional[str] = None
-#     snippet: Optional[str] = None
-#     score: float = None
-#     meta: Optional[dict] = Field(default=None, sa_column=Column(JSON))
-#     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_column=Column(DateTime(timezone=True)))
-#
-#     __table_args__ = (
-#         # Prevent duplicate snippets from same source
-#         UniqueConstraint("source_doc_id", "snippet", name="uq_source_snippet"),
-#     )
-#
-#     linked_messages: list["MessageRetrievedDoc"] = Relationship(back_populates="retrieved_doc", ) # cascade_delete=True
-#
-#
-# class MessageRetrievedDoc(SQLModel, table=True):
-#     id: UUID = Field(default_factory=uuid4, primary_key=True)
-#     message_id: UUID = Field(foreign_key="message.message_id", ondelete="CASCADE")
-#     retrieved_doc_id: UUID = Field(foreign_key="retrieveddoc.retrieved_doc_id", ondelete="CASCADE")
-#     rank: Optional[int] = None
-#
-#     message: Message = Relationship(back_populates="retrieved_docs")
-#     retrieved_doc: RetrievedDoc = Relationship(back_populates="linked_messages")
+    retrieved_docs: list["MessageRetrievedDoc"] = Relationship(back_populates="message", passive_deletes=True,
+                                                               sa_relationship_kwargs={
+                                                                   "order_by": "MessageRetrievedDoc.rank"
+                                                               })
+
+
+class RetrievedDoc(SQLModel, table=True):
+    """Snapshot of a retrieved chunk, stored once per (source file hash, chunk id)."""
+    retrieved_doc_id: UUID = Field(default_factory=uuid4, primary_key=True)
+    source_hash: str
+    chunk_id: str
+    title: Optional[str] = None
+    source: Optional[str] = None
+    snippet: str
+    meta: Optional[dict] = Field(default=None, sa_column=Column(JSONB))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc),
+                                 sa_column=Column(DateTime(timezone=True)))
+
+    __table_args__ = (
+        # the same chunk of the same file version is stored once
+        UniqueConstraint("source_hash", "chunk_id", name="uq_retrieveddoc_source_chunk"),
+    )
+
+    linked_messages: list["MessageRetrievedDoc"] = Relationship(back_populates="retrieved_doc", passive_deletes=True)
+
+
+class MessageRetrievedDoc(SQLModel, table=True):
+    message_id: UUID = Field(foreign_key="message.message_id", primary_key=True, ondelete="CASCADE")
+    retrieved_doc_id: UUID = Field(foreign_key="retrieveddoc.retrieved_doc_id", primary_key=True, ondelete="CASCADE")
+    rank: int
+    score: Optional[float] = None
+
+    message: Message = Relationship(back_populates="retrieved_docs")
+    retrieved_doc: RetrievedDoc = Relationship(back_populates="linked_messages")
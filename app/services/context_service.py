@@ -0,0 +1,158 @@
+import re
+from typing import List, Dict
+
+from app.core.config import settings as server_settings
+from app.utils.logger import logger
+from app.utils.token_utils import count_tokens
+
+
+# ========================================
+# SECTION 5.1: CONTEXT PACKING
+# ========================================
+
+def _result_score(result: Dict) -> float:
+    # "similarity" comes from the rag pipeline, "score" from results stored in DB
+    return float(result.get("similarity", result.get("score", 0.0)) or 0.0)
+
+
+def _chunk_position(result: Dict):
+    """Split a chunk id `<doc id>_chunk_<i>` into its source and position."""
+    source, sep, index = result["id"].rpartition("_chunk_")
+    if sep and index.isdigit():
+        return source, int(index)
+    return result["id"], None
+
+
+# Shortest text accepted as the overlap of two chunks: a few shared characters are a coincidence
+MIN_MERGE_OVERLAP = 10
+
+
+def _merge_texts(first: str, second: str) -> str:
+    """Join two consecutive chunks, dropping the overlap the text splitter repeated."""
+    # the splitter repeats at most CHUNK_OVERLAP characters, made of whole words
+    for size in range(min(len(first), len(second), server_settings.CHUNK_OVERLAP), MIN_MERGE_OVERLAP - 1, -1):
+        overlap = second[:size]
+        if not first.endswith(overlap):
+            continue
+        starts_word = size == len(first) or not first[-size - 1].isalnum() or not overlap[0].isalnum()
+        ends_word = size == len(second) or not second[size].isalnum() or not overlap[-1].isalnum()
+        if starts_word and ends_word:
+            return first + second[size:]
+    return f"{first} {second}"
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _is_near_duplicate(shingles: set, kept: List[set], threshold: float) -> bool:
+    for other in kept:
+        overlap = len(shingles & other)
+        if not overlap:
+            continue
+        # containment catches a short chunk fully repeated inside a merged block
+        if overlap / min(len(shingles), len(other)) >= threshold:
+            return True
+        if overlap / len(shingles | other) >= threshold:
+            return True
+    return False
+
+
+def merge_adjacent_chunks(search_results: List[Dict]) -> List[Dict]:
+    """
+    Merge search results that are consecutive chunks of the same source document.
+
+    Chunks are produced with an overlap, so adjacent hits repeat part of their text;
+    merging them keeps a single copy of the shared text. A merged block keeps the
+    best score of its chunks and lists every chunk id it covers.
+    """
+    by_source = {}
+    for result in search_results:
+        source, index = _chunk_position(result)
+        by_source.setdefault(source, []).append((index, result))
+
+    blocks = []
+    for source, items in by_source.items():
+        positioned = sorted((item for item in items if item[0] is not None), key=lambda item: item[0])
+        unpositioned = [item for item in items if item[0] is None]
+
+        current = None
+        last_index = None
+        for index, result in positioned:
+            if current is not None and index == last_index:
+                # the same chunk retrieved twice
+                current["similarity"] = max(current["similarity"], _result_score(result))
+                continue
+            if current is not None and index == last_index + 1:
+                current["content"] = _merge_texts(current["content"], result["content"])
+                current["similarity"] = max(current["similarity"], _result_score(result))
+                current["chunk_ids"].append(result["id"])
+            else:
+                if current is not None:
+                    blocks.append(current)
+                current = {
+                    "id": result["id"],
+                    "content": result["content"],
+                    "metadata": result.get("metadata", {}),
+                    "similarity": _result_score(result),
+                    "chunk_ids": [result["id"]],
+                }
+            last_index = index
+        if current is not None:
+            blocks.append(current)
+
+        for _, result in unpositioned:
+            blocks.append({
+                "id": result["id"],
+                "content": result["content"],
+                "metadata": result.get("metadata", {}),
+                "similarity": _result_score(result),
+                "chunk_ids": [result["id"]],
+            })
+    return blocks
+
+
+def format_context_block(position: int, block: Dict) -> str:
+    title = block.get("metadata", {}).get("title", "")
+    return f"Source {position}: {title}\n{block['content']}"
+
+
+def pack_context(search_results: List[Dict], token_budget: int = None, model: str = None,
+                 dedup_threshold: float = None) -> List[Dict]:
+    """
+    Select the retrieved context that goes into a prompt.
+
+    This section demonstrates:
+    - Merging overlapping / adjacent chunks of the same source
+    - Near-duplicate removal
+    - Filling a token budget by score, counted with the target model's tokenizer
+    """
+    token_budget = server_settings.CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    dedup_threshold = server_settings.CONTEXT_DEDUP_THRESHOLD if dedup_threshold is None else dedup_threshold
+
+    blocks = merge_adjacent_chunks(search_results)
+    blocks.sort(key=lambda block: block["similarity"], reverse=True)
+
+    packed = []
+    kept_shingles = []
+    used_tokens = 0
+    for block in blocks:
+        shingles = _shingles(block["content"])
+        if _is_near_duplicate(shingles, kept_shingles, dedup_threshold):
+            continue
+        # "Source i: title" header is counted with the worst case position
+        tokens = count_tokens(format_context_block(len(search_results), block), model)
+        if used_tokens + tokens > token_budget:
+            continue
+        block["tokens"] = tokens
+        packed.append(block)
+        kept_shingles.append(shingles)
+        used_tokens += tokens
+
+    logger.debug(
+        f"Packed {len(search_results)} results into {len(packed)} context blocks ({used_tokens}/{token_budget} tokens)"
+    )
+    return packed
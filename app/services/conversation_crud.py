@@ -1,33 +1,42 @@
 # crud.py
-from uuid import UUID
+import base64
+from typing import List, Literal, Optional, Tuple
+from uuid import UUID, uuid4
 
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import Uuid, column, insert, tuple_, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import selectinload
 from sqlalchemy.exc import SQLAlchemyError
-from app.models.conversation_models import Session as ChatSession, Message, MessageData
+from app.models.conversation_models import Session as ChatSession, Message, MessageData, SUMMARY_KEY, \
+    RetrievedDoc, MessageRetrievedDoc
 from app.models.schemas_models import Message as response_message
 
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException, status
+from app.core.tracing import traced
 from app.utils.logger import logger
+from app.utils.token_utils import count_message_tokens
 
 
-def create_session(user_id: UUID, db: Session, title: str = None, metadata=None):
+@traced()
+async def create_session(user_id: UUID, db: AsyncSession, title: str = None, metadata=None):
     try:
         new_session = ChatSession(title=title, user_id=user_id)
         db.add(new_session)
-        db.commit()
-        db.refresh(new_session)
+        await db.commit()
+        await db.refresh(new_session)
         return new_session
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         logger.exception(f"Unexpected error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Database error while creating new session."
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         # Catch any other unexpected exceptions
         logger.exception(f"Unexpected error: {str(e)}")
         raise HTTPException(
@@ -36,30 +45,31 @@ def create_session(user_id: UUID, db: Session, title: str = None, metadata=None)
         )
 
 
-def delete_session(db: Session, session_id: str) -> response_message:
+@traced()
+async def delete_session(db: AsyncSession, session_id: str) -> response_message:
     try:
-        session = db.get(ChatSession, session_id)
+        session = await db.get(ChatSession, session_id)
         if not session:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Chat session with id={session_id} not found."
             )
-        db.delete(session)
-        db.commit()
+        await db.delete(session)
+        await db.commit()
         return response_message(message="Conversation deleted successfully")
     except HTTPException:
         # Re-raise HTTPException so FastAPI can handle it properly
-        db.rollback()
+        await db.rollback()
         raise
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         logger.exception(f"Unexpected error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Database error while deleting session."
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         # Catch any other unexpected exceptions
         logger.error(str(e))
         raise HTTPException(
@@ -68,17 +78,20 @@ def delete_session(db: Session, session_id: str) -> response_message:
         )
 
 
-def get_full_session(db: Session, session_id: str):
+@traced()
+async def get_full_session(db: AsyncSession, session_id: str):
     try:
         query = (
             select(ChatSession)
             .where(ChatSession.session_id == session_id)
             .options(
                 selectinload(ChatSession.messages)
+                .selectinload(Message.retrieved_docs)
+                .selectinload(MessageRetrievedDoc.retrieved_doc)
             )
         )
 
-        session_obj = db.exec(query).one_or_none()
+        session_obj = (await db.exec(query)).one_or_none()
         if not session_obj:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -105,11 +118,190 @@ def get_full_session(db: Session, session_id: str):
         )
 
 
-def get_all_sessions(user_id: UUID, db: Session, limit: int = 10):
+@traced()
+async def get_session(db: AsyncSession, session_id, user_id: UUID = None) -> ChatSession:
+    """Get a chat session without loading its messages; with `user_id`, only a session of that user."""
     try:
-        sessions = db.exec(
+        session_obj = await db.get(ChatSession, session_id)
+        # another user's session is reported missing: its id is not disclosed
+        if not session_obj or (user_id is not None and session_obj.user_id != user_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Chat session with id={session_id} not found."
+            )
+        return session_obj
+    except HTTPException:
+        # Re-raise HTTPException so FastAPI can handle it properly
+        raise
+    except SQLAlchemyError as e:
+        logger.exception(f"Unexpected error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error while get session."
+        )
+    except Exception as e:
+        logger.error(str(e))
+        # Catch any other unexpected exceptions
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Unexpected error: {str(e)}"
+        )
+
+
+def encode_cursor(message: Message) -> str:
+    raw = f"{message.created_at.isoformat()}|{message.message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), UUID(message_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor."
+        )
+
+
+@traced()
+async def get_messages_page(db: AsyncSession, session_id, limit: int = 50, cursor: Optional[str] = None,
+                      order: Literal["asc", "desc"] = "desc") -> Tuple[List[Message], Optional[str]]:
+    """
+    Get one page of a session's messages, keyset-paginated on (created_at, message_id).
+
+    `order="desc"` walks from the newest message back in time, `order="asc"` from the oldest one.
+    Returns the page and the cursor of the next page (None when there is no next page).
+    """
+    try:
+        key = tuple_(Message.created_at, Message.message_id)
+        query = (
+            select(Message)
+            .where(Message.session_id == session_id)
+            .options(selectinload(Message.retrieved_docs).selectinload(MessageRetrievedDoc.retrieved_doc))
+        )
+        if cursor:
+            position = tuple_(*decode_cursor(cursor))
+            query = query.where(key < position if order == "desc" else key > position)
+        if order == "desc":
+            query = query.order_by(Message.created_at.desc(), Message.message_id.desc())
+        else:
+            query = query.order_by(Message.created_at, Message.message_id)
+
+        # fetch one extra row to know if there is a next page
+        messages = list((await db.exec(query.limit(limit + 1))).all())
+        next_cursor = None
+        if len(messages) > limit:
+            messages = messages[:limit]
+            next_cursor = encode_cursor(messages[-1])
+        return messages, next_cursor
+    except HTTPException:
+        # Re-raise HTTPException so FastAPI can handle it properly
+        raise
+    except SQLAlchemyError as e:
+        logger.exception(f"Unexpected error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error while get session's messages."
+        )
+    except Exception as e:
+        logger.error(str(e))
+        # Catch any other unexpected exceptions
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Unexpected error: {str(e)}"
+        )
+
+
+@traced()
+async def get_chat_window(db: AsyncSession, session_id, max_messages: int = 200) -> List[Message]:
+    """
+    Load the messages the agent needs for its next turn, oldest first.
+
+    That is the latest stored summary (if any) followed by the messages it doesn't cover,
+    capped to the `max_messages` most recent ones, instead of the whole session.
+    """
+    try:
+        summary = (await db.exec(
+            select(Message)
+            .where(Message.session_id == session_id)
+            .where(Message.data["additional_kwargs"][SUMMARY_KEY].isnot(None))
+            .order_by(Message.created_at.desc(), Message.message_id.desc())
+            .limit(1)
+        )).first()
+
+        query = select(Message).where(Message.session_id == session_id)
+        if summary is not None:
+            summarized = summary.data["additional_kwargs"][SUMMARY_KEY]
+            until = (datetime.fromisoformat(summarized["until_created_at"]), UUID(summarized["until_id"]))
+            query = query.where(tuple_(Message.created_at, Message.message_id) > tuple_(*until))
+        query = query.order_by(Message.created_at.desc(), Message.message_id.desc()).limit(max_messages)
+        messages = list((await db.exec(query)).all())[::-1]  # return ascending order
+
+        if len(messages) == max_messages:
+            # the window was cut: don't start in the middle of a turn
+            roles = [message.data.get("role") for message in messages]
+            if "user" in roles:
+                messages = messages[roles.index("user"):]
+            else:
+                # one long run of tool exchanges: keep it, minus the tool results whose call was cut
+                while messages and messages[0].data.get("role") == "tool":
+                    messages.pop(0)
+        if summary is not None and summary not in messages:
+            messages.insert(0, summary)
+        return messages
+    except HTTPException:
+        # Re-raise HTTPException so FastAPI can handle it properly
+        raise
+    except SQLAlchemyError as e:
+        logger.exception(f"Unexpected error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error while get session's messages."
+        )
+    except Exception as e:
+        logger.error(str(e))
+        # Catch any other unexpected exceptions
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Unexpected error: {str(e)}"
+        )
+
+
+@traced()
+async def get_tool_messages_by_cache_key(db: AsyncSession, session_id, cache_keys) -> dict:
+    """
+    Find the latest tool result stored in a session for each of the given tool cache keys.
+
+    Only messages holding the actual results are returned, not the ones referencing them.
+    """
+    try:
+        if not cache_keys:
+            return {}
+        cache_key = Message.data["additional_kwargs"]["cache_key"].as_string()
+        messages = (await db.exec(
+            select(Message)
+            .where(Message.session_id == session_id)
+            .where(cache_key.in_(list(cache_keys)))
+            .where(Message.data["additional_kwargs"]["cached_from"].is_(None))
+            .order_by(Message.created_at, Message.message_id)
+        )).all()
+        # later messages override earlier ones
+        return {message.data["additional_kwargs"]["cache_key"]: message for message in messages}
+    except SQLAlchemyError as e:
+        logger.exception(f"Unexpected error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error while get cached tool results."
+        )
+
+
+@traced()
+async def get_all_sessions(user_id: UUID, db: AsyncSession, limit: int = 10):
+    try:
+        sessions = (await db.exec(
             select(ChatSession).where(ChatSession.user_id == user_id).order_by(ChatSession.created_at.desc()).limit(
-                limit)).all()
+                limit))).all()
         return sessions
     except SQLAlchemyError as e:
         logger.exception(f"Unexpected error: {str(e)}")
@@ -126,16 +318,21 @@ def get_all_sessions(user_id: UUID, db: Session, limit: int = 10):
         )
 
 
-def add_message(db: Session, session_id, data: dict, tokens=None):
+@traced()
+async def add_message(db: AsyncSession, session_id, data: dict, tokens=None):
     try:
         # Get the chat session
-        session = db.get(ChatSession, session_id)
+        session = await db.get(ChatSession, session_id)
         if not session:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Chat session with id={session_id} not found."
             )
 
+        # Count the message tokens once at write time, history windowing reuses the stored count
+        if tokens is None:
+            tokens = count_message_tokens(data)
+
         # Create the message
         message = Message(session_id=session_id, data=data, tokens=tokens)
         db.add(message)
@@ -161,62 +358,164 @@ def add_message(db: Session, session_id, data: dict, tokens=None):
             detail=f"Unexpected error: {str(e)}"
         )
 
-# def get_messages(db: Session, session_id: str, limit: int = 50):
-#     stmt = select(Message).where(Message.session_id == session_id).order_by(Message.created_at.desc()).limit(limit)
-#     return db.exec(stmt).all()[::-1]  # return ascending order
-# from app.models.conversation_models import RetrievedDoc, MessageRetrievedDoc
-# from typing import List
-# def attach_retrieved_docs(db: Session, message_id, docs: List[dict]):
-#     """
-#     docs: list of {source_doc_id, title, snippet, score, metadata, rank}
-#     This will insert retrieved_docs and link them to the message.
-#     """
-#     try:
-#         for d in docs:
-#             existing = db.exec(
-#                 select(RetrievedDoc).where(
-#                     (RetrievedDoc.source_doc_id == d.get("id")) &
-#                     (RetrievedDoc.snippet == d.get("content"))
-#                 )
-#             ).first()
-#
-#             if existing:
-#                 link = MessageRetrievedDoc(message_id=message_id, retrieved_doc_id=existing.retrieved_doc_id,
-#                                            rank=d.get("similarity"))
-#                 db.add(link)
-#                 continue
-#             else:
-#                 rd = RetrievedDoc(
-#                     source_doc_id=d.get("id"),
-#                     title=d.get("title"),
-#                     snippet=d.get("content"),
-#                     score=d.get("similarity"),
-#                     meta=d.get("metadata")
-#                 )
-#
-#                 db.add(rd)
-#                 db.commit()
-#                 db.refresh(rd)
-#
-#                 link = MessageRetrievedDoc(message_id=message_id, retrieved_doc_id=rd.retrieved_doc_id,
-#                                            rank=d.get("similarity"))
-#                 db.add(link)
-#         db.commit()
-#     except HTTPException:
-#         # Re-raise HTTPException so FastAPI can handle it properly
-#         db.rollback()
-#         raise
-#     except SQLAlchemyError as e:
-#         db.rollback()
-#         # Optionally log e for debugging
-#         raise HTTPException(
-#             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-#             detail="Database error while adding retrieved_docs."
-#         )
-#     except Exception as e:
-#         db.rollback()
-#         # Catch any other unexpected exceptions
-#         raise HTTPException(
-#             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-#             detail=f"Unexpected error: {str(e)}"
-#         )
+class ChatTurn:
+    """
+    Unit of work of one agent turn: the messages of the turn are buffered and written together.
+
+    The session is validated once by the caller (`get_session`), then `commit()` stores all
+    the buffered messages with one bulk insert, updates the session activity once, links the
+    retrieval provenance and commits, instead of one round-trip per message.
+    """
+
+    def __init__(self, db: AsyncSession, session: ChatSession):
+        self.db = db
+        self.session = session
+        self.messages: List[Message] = []
+        # (message_id, search results) of the turn, see `attach_retrieved_docs`
+        self.retrievals: List[Tuple[UUID, List[dict]]] = []
+        # (message_id, message_id of the reused results) of the turn, see `copy_retrieved_docs`
+        self.copied_retrievals: List[Tuple[UUID, UUID]] = []
+
+    @property
+    def session_id(self) -> UUID:
+        return self.session.session_id
+
+    def add_message(self, data: dict, tokens=None) -> Message:
+        """Buffer a message of the turn, its id and timestamp are assigned here."""
+        # Count the message tokens once at write time, history windowing reuses the stored count
+        if tokens is None:
+            tokens = count_message_tokens(data)
+        created_at = datetime.now(timezone.utc)
+        if self.messages and created_at <= self.messages[-1].created_at:
+            # keep the (created_at, message_id) order of the turn strictly increasing
+            created_at = self.messages[-1].created_at + timedelta(microseconds=1)
+        message = Message(message_id=uuid4(), session_id=self.session_id, data=data, tokens=tokens,
+                          created_at=created_at)
+        self.messages.append(message)
+        return message
+
+    def attach_retrieved_docs(self, message_id: UUID, search_results: List[dict]):
+        self.retrievals.append((message_id, search_results))
+
+    def copy_retrieved_docs(self, message_id: UUID, from_message_id: UUID):
+        self.copied_retrievals.append((message_id, from_message_id))
+
+    @traced()
+    async def commit(self):
+        try:
+            if self.messages:
+                await self.db.execute(insert(Message).values([
+                    {
+                        "message_id": message.message_id,
+                        "session_id": message.session_id,
+                        "data": message.data,
+                        "tokens": message.tokens,
+                        "created_at": message.created_at,
+                    }
+                    for message in self.messages
+                ]))
+                # Update session last active (flushed with the commit)
+                self.session.last_active_at = self.messages[-1].created_at
+            await attach_retrieved_docs(self.db, self.retrievals)
+            await copy_retrieved_docs(self.db, self.copied_retrievals)
+            await self.db.commit()
+            self.messages, self.retrievals, self.copied_retrievals = [], [], []
+        except HTTPException:
+            await self.db.rollback()
+            raise
+        except SQLAlchemyError as e:
+            await self.db.rollback()
+            logger.exception(f"Unexpected error: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Database error while adding messages."
+            )
+
+
+@traced()
+async def attach_retrieved_docs(db: AsyncSession, retrievals: List[Tuple[UUID, List[dict]]]):
+    """
+    Store the provenance of the chunks retrieved for messages.
+
+    retrievals: list of (message_id, search results) where search results are
+    {id, content, metadata: {title, source, hash}, similarity} in rank order.
+    The chunk snapshots of all messages are upserted in one statement (deduplicated on
+    source hash + chunk id) and linked to their messages in a second one.
+    """
+    try:
+        docs = {}
+        for _, search_results in retrievals:
+            for result in search_results:
+                metadata = result.get("metadata") or {}
+                key = (metadata.get("hash") or "", result["id"])
+                docs.setdefault(key, {
+                    "retrieved_doc_id": uuid4(),
+                    "source_hash": key[0],
+                    "chunk_id": key[1],
+                    "title": metadata.get("title"),
+                    "source": metadata.get("source"),
+                    "snippet": result["content"],
+                    "meta": metadata,
+                    "created_at": datetime.now(timezone.utc),
+                })
+        if not docs:
+            return
+
+        # the messages being linked may still be pending in the session
+        await db.flush()
+
+        upsert = pg_insert(RetrievedDoc).values(list(docs.values()))
+        upsert = upsert.on_conflict_do_update(
+            constraint="uq_retrieveddoc_source_chunk",
+            # no-op update so RETURNING also yields the ids of already stored snapshots
+            set_={"source_hash": upsert.excluded.source_hash},
+        ).returning(RetrievedDoc.retrieved_doc_id, RetrievedDoc.source_hash, RetrievedDoc.chunk_id)
+        doc_ids = {(source_hash, chunk_id): doc_id for doc_id, source_hash, chunk_id in await db.execute(upsert)}
+
+        links = {}
+        for message_id, search_results in retrievals:
+            for rank, result in enumerate(search_results, 1):
+                key = ((result.get("metadata") or {}).get("hash") or "", result["id"])
+                links.setdefault((message_id, doc_ids[key]), {
+                    "message_id": message_id,
+                    "retrieved_doc_id": doc_ids[key],
+                    "rank": rank,
+                    "score": result.get("similarity"),
+                })
+        await db.execute(pg_insert(MessageRetrievedDoc).values(list(links.values())).on_conflict_do_nothing())
+    except SQLAlchemyError as e:
+        logger.exception(f"Unexpected error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error while adding retrieved_docs."
+        )
+
+
+@traced()
+async def copy_retrieved_docs(db: AsyncSession, copies: List[Tuple[UUID, UUID]]):
+    """
+    Link messages to the chunks retrieved for other messages, with their rank and score.
+
+    copies: list of (message_id, from_message_id), e.g. a tool message replaying the cached
+    results of an earlier call. All the links are copied with one INSERT ... SELECT.
+    """
+    if not copies:
+        return
+    try:
+        pairs = values(column("message_id", Uuid), column("from_message_id", Uuid), name="copies").data(copies)
+        links = (
+            select(pairs.c.message_id, MessageRetrievedDoc.retrieved_doc_id,
+                   MessageRetrievedDoc.rank, MessageRetrievedDoc.score)
+            .join(pairs, MessageRetrievedDoc.message_id == pairs.c.from_message_id)
+        )
+        await db.execute(
+            pg_insert(MessageRetrievedDoc)
+            .from_select(["message_id", "retrieved_doc_id", "rank", "score"], links)
+            .on_conflict_do_nothing()
+        )
+    except SQLAlchemyError as e:
+        logger.exception(f"Unexpected error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error while copying retrieved_docs."
+        )
@@ -0,0 +1,152 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings as server_settings
+from app.utils.logger import logger
+from app.utils.smtp_utils import send_email, smtp_connection
+
+
+# ========================================
+# SECTION 10: BACKGROUND EMAIL DELIVERY
+# ========================================
+
+@dataclass
+class OutgoingEmail:
+    email_to: str
+    subject: str
+    html_content: str
+    attempts: int = 0
+    delivered: bool = False
+
+
+def _close_quietly(smtp):
+    # closing sends QUIT, which fails on a dead connection; the client is dropped either way
+    try:
+        smtp.close()
+    except Exception as e:
+        logger.debug(f"Closing SMTP connection failed: {e}")
+
+
+class EmailQueue:
+    """
+    Outbound email queue drained by a background worker.
+
+    This section demonstrates:
+    - Returning from the request right away, whatever the SMTP latency
+    - Sending each batch of queued emails over a single SMTP connection
+    - Retrying failed deliveries with exponential backoff
+    """
+
+    def __init__(self, batch_size: int, max_attempts: int, backoff_seconds: float):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker: Optional[asyncio.Task] = None
+        # emails waiting for their retry delay, by id(email)
+        self._retries: Dict[int, Tuple[asyncio.TimerHandle, OutgoingEmail]] = {}
+        self.sent = 0
+        self.failed = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run(), name="email-queue")
+
+    async def stop(self, timeout: float = 10.0):
+        """Wait (up to `timeout`) for the queued emails to be sent, then stop the worker."""
+        if self._worker is None:
+            return
+        # emails waiting for a retry get their last attempt now instead of being dropped
+        for handle, email in self._retries.values():
+            handle.cancel()
+            self._queue.put_nowait(email)
+        self._retries.clear()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping email queue with {self._queue.qsize()} unsent emails")
+        unsent = [self._queue.get_nowait() for _ in range(self._queue.qsize())]
+        unsent += [email for _, email in self._retries.values()]
+        if unsent:
+            logger.error(f"Email queue stopped, not sent: {', '.join(email.email_to for email in unsent)}")
+        self._worker.cancel()
+        self._worker, self._loop = None, None
+
+    def enqueue(self, *, email_to: str, subject: str = "", html_content: str = "") -> None:
+        """Queue an email, callable from the event loop or from a worker thread (sync endpoints)."""
+        email = OutgoingEmail(email_to=email_to, subject=subject, html_content=html_content)
+        if self._loop is None:
+            # no worker running (e.g. scripts), send it in place
+            send_email(email_to=email_to, subject=subject, html_content=html_content)
+            return
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, email)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                failed = await asyncio.to_thread(self._send_batch, batch)
+            except Exception as e:
+                logger.exception(f"Email worker error: {e}")
+                # e.g. the SMTP configuration: nothing of the batch is lost
+                failed = [email for email in batch if not email.delivered]
+            try:
+                for email in failed:
+                    self._retry(email)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _send_batch(self, batch: List[OutgoingEmail]) -> List[OutgoingEmail]:
+        """Send a batch over one SMTP connection, return the emails that failed."""
+        failed = []
+        smtp = smtp_connection()
+        try:
+            for email in batch:
+                email.attempts += 1
+                try:
+                    send_email(email_to=email.email_to, subject=email.subject,
+                               html_content=email.html_content, smtp=smtp)
+                    email.delivered = True
+                    self.sent += 1
+                except Exception as e:
+                    logger.warning(f"Sending email to {email.email_to} failed "
+                                   f"(attempt {email.attempts}/{self.max_attempts}): {e}")
+                    failed.append(email)
+                    # the connection may be broken: drop it, the next email reconnects
+                    _close_quietly(smtp)
+        finally:
+            _close_quietly(smtp)
+        return failed
+
+    def _retry(self, email: OutgoingEmail):
+        if email.attempts >= self.max_attempts:
+            self.failed += 1
+            logger.error(f"Giving up sending email to {email.email_to} after {email.attempts} attempts")
+            return
+        delay = self.backoff_seconds * 2 ** max(0, email.attempts - 1)
+        handle = self._loop.call_later(delay, self._requeue, email)
+        self._retries[id(email)] = (handle, email)
+
+    def _requeue(self, email: OutgoingEmail):
+        self._retries.pop(id(email), None)
+        self._queue.put_nowait(email)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "sent": self.sent,
+            "failed": self.failed,
+        }
+
+
+email_queue = EmailQueue(
+    batch_size=server_settings.EMAIL_BATCH_SIZE,
+    max_attempts=server_settings.EMAIL_MAX_ATTEMPTS,
+    backoff_seconds=server_settings.EMAIL_RETRY_BACKOFF_SECONDS,
+)
@@ -1,11 +1,12 @@
+from functools import lru_cache
 from typing import List, Dict
+from uuid import UUID
 
-import chromadb
-from chromadb.config import Settings
-
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from app.utils.file_loader import read_docs
+from app.utils.text_utils import compute_bytes_hash
 
+from app.core.config import settings as server_settings
+from app.core.tracing import traced
 from app.utils.logger import logger
 
 
@@ -13,39 +14,51 @@ from app.utils.logger import logger
 # SECTION 1: DOCUMENT LOADING & CHUNKING
 # ========================================
 
-def load_and_chunk_documents(path: str):
+def get_text_splitter(chunk_size: int = None, chunk_overlap: int = None):
+    """Text splitter of the index, with the settings' chunk size and overlap unless given."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    # Configure text splitter from langchain
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size or server_settings.CHUNK_SIZE,  # What is the chunk size?
+        chunk_overlap=server_settings.CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap,  # What is the overlap?
+        length_function=len,
+        # separators=["\n\n", "\n", " ", ""], # default values
+    )
+
+
+def chunk_document(doc: Dict, text_splitter) -> List[Dict]:
+    """Split a loaded document (see `read_docs`) into the chunks stored in the vector store."""
+    chunks = text_splitter.split_text(doc["content"])
+    return [
+        {
+            "id": f"{doc['id']}_chunk_{i}",
+            "content": chunk,
+            "title": doc["title"],
+            "source_hash": doc["metadata"]["hash"],
+            "source_doc": doc["metadata"]["file_name"],
+            "source_path": doc["metadata"]["file_path"],
+        }
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+@traced()
+def load_and_chunk_documents(path: str, chunk_size: int = None, chunk_overlap: int = None):
     """
     Load sample documents and chunk them for better retrieval.
     This section demonstrates:
     - Documents loading
     - Text chunking using LangChain
-    - Chunk size and overlap configuration
+    - Chunk size and overlap configuration (the settings' ones unless given)
     """
     wiki_articles, _ = read_docs(path)
-
-    # Configure text splitter from langchain
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=200,  # What is the chunk size?
-        chunk_overlap=50,  # What is the overlap?
-        length_function=len,
-        # separators=["\n\n", "\n", " ", ""], # default values
-    )
+    text_splitter = get_text_splitter(chunk_size, chunk_overlap)
 
     # Chunk all documents
     all_chunks = []
     for doc in wiki_articles:
-        chunks = text_splitter.split_text(doc["content"])
-        for i, chunk in enumerate(chunks):
-            all_chunks.append(
-                {
-                    "id": f"{doc['id']}_chunk_{i}",
-                    "content": chunk,
-                    "title": doc["title"],
-                    "source_hash": doc["metadata"]["hash"],
-                    "source_doc": doc["metadata"]["file_name"],
-                    "source_path": doc["metadata"]["file_path"],
-                }
-            )
+        all_chunks.extend(chunk_document(doc, text_splitter))
     return all_chunks
 
 
@@ -53,22 +66,55 @@ def load_and_chunk_documents(path: str):
 # SECTION 2: VECTOR DATABASE SETUP
 # ========================================
 
-def setup_vector_database(chunks: List[Dict]):
+@lru_cache(maxsize=1)
+def get_chroma_client():
+    """ChromaDB client of the vector store, opened once on first use."""
+    import chromadb
+    from chromadb.config import Settings
+
+    return chromadb.PersistentClient(server_settings.VECTOR_DB_PATH, settings=Settings(anonymized_telemetry=False))
+
+
+def hnsw_configuration(collection_name: str) -> Dict:
+    """HNSW parameters of a collection: the settings' defaults and the overrides of this collection."""
+    configuration = {
+        "space": server_settings.HNSW_SPACE,
+        "max_neighbors": server_settings.HNSW_M,
+        "ef_construction": server_settings.HNSW_CONSTRUCTION_EF,
+        "ef_search": server_settings.HNSW_SEARCH_EF,
+        "batch_size": server_settings.HNSW_BATCH_SIZE,
+        "sync_threshold": server_settings.HNSW_SYNC_THRESHOLD,
+    }
+    configuration.update(server_settings.HNSW_COLLECTION_OVERRIDES.get(collection_name, {}))
+    return configuration
+
+
+def get_or_create_collection(name: str = None):
+    """Open a collection of the vector store, created with its HNSW configuration if missing."""
+    name = name or server_settings.COLLECTION_NAME
+    if name == server_settings.COLLECTION_NAME and server_settings.VECTOR_SHARDS > 1:
+        # the shared corpus is spread over shard processes, see `shard_service`
+        from app.services.shard_service import get_sharded_collection
+
+        return get_sharded_collection()
+    return get_chroma_client().get_or_create_collection(name=name,
+                                                        configuration={"hnsw": hnsw_configuration(name)})
+
+
+@traced()
+def setup_vector_database(chunks: List[Dict], collection_name: str = None):
     """
     Set up ChromaDB vector database and store document chunks.
 
     This section demonstrates:
     - ChromaDB client initialization
-    - Collection creation
+    - Collection creation with its HNSW index parameters
     - Document embedding and storage
     - Vector database configuration
     """
-    # Initialize ChromaDB client
-    chroma_client = chromadb.PersistentClient("vector_db/chroma", settings=Settings(anonymized_telemetry=False))
-
-    # Create collection (what is the collection name? | What similarity metric is used? | embedding_functions)
-    collection = chroma_client.get_or_create_collection(name="wiki_articles_v1", metadata={
-        "hnsw:space": "cosine"}, )
+    # Initialize ChromaDB client and create the collection (similarity metric and index
+    # parameters: see `hnsw_configuration`)
+    collection = get_or_create_collection(collection_name or server_settings.COLLECTION_NAME)
 
     # Add documents to collection (embeddings will be generated automatically)
     ids = []
@@ -91,12 +137,67 @@ def setup_vector_database(chunks: List[Dict]):
     return collection
 
 
+# ========================================
+# SECTION 2.1: PRIVATE USER COLLECTIONS
+# ========================================
+
+def user_collection_name(user_id: UUID) -> str:
+    """Collection holding the documents uploaded by a user, next to the shared corpus."""
+    return f"{server_settings.USER_COLLECTION_PREFIX}{user_id.hex}"
+
+
+@traced()
+def index_user_document(user_id: UUID, file_name: str, content: bytes) -> int:
+    """
+    Chunk and store a document uploaded by a user in the user's own collection.
+
+    This section demonstrates:
+    - One collection per user: search cost follows the user's own data
+    - Chunk ids prefixed with the collection name (see `retriever_service.collection_of_chunk`)
+    - Replacing the previous version of a re-uploaded file
+    """
+    collection_name = user_collection_name(user_id)
+    doc_id = f"{collection_name}/{file_name}"
+    doc = {
+        "id": doc_id,
+        "title": file_name,
+        "content": content.decode("utf-8").strip(),
+        "metadata": {"file_name": file_name, "file_path": doc_id, "hash": compute_bytes_hash(content)},
+    }
+    chunks = chunk_document(doc, get_text_splitter())
+    collection = get_or_create_collection(collection_name)
+    collection.delete(where={"source": file_name})
+    if chunks:
+        setup_vector_database(chunks, collection_name)
+    logger.info(f"Indexed {file_name} ({len(chunks)} chunks) in {collection_name}")
+    return len(chunks)
+
+
+def delete_user_collection(user_id: UUID) -> bool:
+    """Drop the uploaded documents of a user, False if there were none."""
+    from chromadb.errors import NotFoundError
+
+    try:
+        get_chroma_client().delete_collection(user_collection_name(user_id))
+        return True
+    except NotFoundError:
+        return False
+
+
 # ========================================
 # SECTION 3: QUERY PROCESSING
 # ========================================
-from sentence_transformers import SentenceTransformer
+
+@lru_cache(maxsize=1)
+def get_embedding_model():
+    """Query embedding model, loaded once on first use instead of on every query."""
+    from sentence_transformers import SentenceTransformer
+
+    # What embedding model is used? same as chroma vector store
+    return SentenceTransformer(server_settings.EMBEDDING_MODEL)
 
 
+@traced()
 def process_user_query(query: str):
     """
     Process user query and convert to embedding for vector search.
@@ -108,7 +209,7 @@ def process_user_query(query: str):
     - Query optimization
     """
     # Load embedding model (what model is used?)
-    model = SentenceTransformer("all-MiniLM-L6-v2")  # What embedding model is used? same as chroma vector store
+    model = get_embedding_model()
 
     # Preprocess query
     cleaned_query = query.lower().strip()
@@ -1,26 +1,30 @@
-from llama_index.llms.ollama import Ollama
+import asyncio
+import json
+import re
+import time
+from contextvars import ContextVar
+from uuid import UUID
+
 from llama_index.core.llms import ChatMessage
 from llama_index.core.tools import FunctionTool
 
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from app.services import conversation_crud
 from app.models import conversation_models
 from app.utils.logger import logger
-from app.services.retriever_service import search_query_pipline
+from app.services.llm_service import get_llm
+from app.services.retriever_service import search_query_pipline, get_chunks, resolve_ef_search
+from app.services.context_service import pack_context, format_context_block
+from app.services.history_service import select_history, history_token_budget, message_tokens, \
+    split_summarized, update_summary, summary_chat_message
+from app.core.config import settings as server_settings
+from app.core.tracing import span, traced, annotate_llm_span
+from app.core.metrics import stage_duration, current_endpoint, tool_calls as tool_calls_metric, cache_hits, \
+    cache_misses, record_llm_usage
+from app.utils.token_utils import count_message_tokens
 from typing import Annotated
 
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.core import Settings
-
-Settings.embed_model = HuggingFaceEmbedding(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-Settings.llm = Ollama(
-    model="llama3.1:8b",  # local model name
-    request_timeout=360.0,
-    context_window=8000
-)
-
 
 # dp_model = Ollama(
 #     model="deepseek-r1:8b",  # local model name
@@ -35,7 +39,7 @@ Settings.llm = Ollama(
 # SECTION 5: CONTEXT AUGMENTATION
 # ========================================
 
-def augment_prompt_with_context(query: str, search_results: List[Dict]) -> str:
+def augment_prompt_with_context(query: str, search_results: List[Dict], token_budget: int = None) -> str:
     """
     Build augmented prompt with retrieved context for LLM.
 
@@ -43,19 +47,12 @@ def augment_prompt_with_context(query: str, search_results: List[Dict]) -> str:
     - Context assembly from search results
     - Prompt construction
     - Information formatting
-    - Context length management
+    - Context length management (see `pack_context`)
     """
-    # Assemble context from search results
+    # Assemble context from search results, packed into the token budget
     context_parts = []
-    for i, result in enumerate(search_results, 1):
-        if "similarity" in result:  # coming from rag pipeline
-            context_parts.append(
-                f"Source {i}: {result['metadata']['title']}\n{result['content']}"
-            )
-        elif "score" in result:  # coming from DB to build chat history
-            context_parts.append(
-                f"Source {i}: {result['metadata']['title']}\n{result['content']}"
-            )
+    for i, block in enumerate(pack_context(search_results, token_budget=token_budget), 1):
+        context_parts.append(format_context_block(i, block))
 
     context = "\n\n".join(context_parts)
 
@@ -89,20 +86,23 @@ def generate_response(augmented_prompt: str):
     - Answer synthesis
     - Output structure
     """
-    model = Ollama(
-        model="llama3.1:8b",  # local model name
-        request_timeout=360.0,
-        # Manually set the context window to limit memory usage
-        context_window=8000,
-    )
+    model = get_llm(server_settings.LLM_MODEL)
 
     # LLM processing...
-    response = model.chat(messages=[ChatMessage(
-        role="user", content=augmented_prompt)
-    ])
+    with span("llm.chat", model=server_settings.LLM_MODEL) as llm_span:
+        response = model.chat(messages=[ChatMessage(
+            role="user", content=augmented_prompt)
+        ])
+        annotate_llm_span(llm_span, response)
+    record_llm_usage(server_settings.LLM_MODEL, response)
     return response
 
 
+# Owner of the chat session being answered: the search tool also covers the owner's uploads
+# (tool calls run in worker threads with a copy of the request context)
+search_user_id: ContextVar[Optional[UUID]] = ContextVar("search_user_id", default=None)
+
+
 def search_documents_v1(query: Annotated[
     str, "The search query used to find relevant text segments"
 ]) -> List[dict]:
@@ -132,7 +132,9 @@ def search_documents_v1(query: Annotated[
     ]
     """
     if query.strip() != "":
-        search_results = search_query_pipline(query)
+        # latency-sensitive: the agent may call it several times per turn
+        search_results = search_query_pipline(query, ef_search=resolve_ef_search(server_settings.AGENT_SEARCH_PROFILE),
+                                              user_id=search_user_id.get())
         return search_results
     return []
 
@@ -237,83 +239,319 @@ Default = “no tool”.
 """
 
 
-async def ask_agent_v1(session: conversation_models.SessionPublic, db):
+async def _before_deadline(deadline: float, awaitable):
+    """Await a step of the agent loop, raising asyncio.TimeoutError once the turn's deadline passes."""
+    return await asyncio.wait_for(awaitable, timeout=max(0.0, deadline - time.perf_counter()))
+
+
+def _call_tool(tools_by_name: Dict[str, FunctionTool], tool_call):
+    """Run one tool call requested by the LLM, returns its search results or an error text."""
+    tool = tools_by_name.get(tool_call.tool_name)
+    if tool is None:
+        tool_calls_metric.inc(tool=tool_call.tool_name, status="unknown")
+        return f"Error: unknown tool {tool_call.tool_name}"
+
+    logger.info(f"Calling {tool_call.tool_name} with {tool_call.tool_kwargs}")
+    try:
+        with span(f"tool.{tool_call.tool_name}", **{f"arg.{key}": value for key, value in tool_call.tool_kwargs.items()}):
+            output = tool.call(**tool_call.tool_kwargs).raw_output
+        tool_calls_metric.inc(tool=tool_call.tool_name, status="ok")
+        return output
+    except Exception as e:
+        logger.error(f"Tool {tool_call.tool_name} failed: {str(e)}")
+        tool_calls_metric.inc(tool=tool_call.tool_name, status="error")
+        return f"Error: {tool_call.tool_name} failed"
+
+
+def format_tool_results(search_results: List[Dict]) -> str:
+    """Text sent to the LLM for search results, packed into the context token budget."""
+    blocks = pack_context(search_results, model=server_settings.AGENT_MODEL)
+    if not blocks:
+        return "No relevant documents found."
+    return "\n\n".join(
+        f"[{block['id']}] {block.get('metadata', {}).get('title', '')}\n{block['content']}" for block in blocks
+    )
+
+
+def compact_tool_results(search_results: List[Dict]) -> Dict:
+    """What a tool message stores of its search results: chunk ids and scores, not their text."""
+    return {
+        "chunks": [{"id": result["id"], "score": round(float(result.get("similarity", 0.0)), 4)}
+                   for result in search_results],
+        "index_version": server_settings.INDEX_VERSION,
+    }
+
+
+STALE_TOOL_RESULTS_TEXT = "Results from a previous version of the document index, run the search again if needed."
+
+
+def is_stale_tool_message(message: conversation_models.Message) -> bool:
+    """Compact tool message stored for another index version (chunking) than the current one."""
+    additional_kwargs = message.data.get("additional_kwargs", {})
+    return "chunks" in additional_kwargs and additional_kwargs.get("index_version") != server_settings.INDEX_VERSION
+
+
+@traced()
+def rehydrate_tool_messages(messages: List[conversation_models.Message]) -> Dict[str, str]:
+    """Rebuild the text of compact tool messages from the chunk store, with one lookup for all of them."""
+    compact = [message for message in messages
+               if message.data.get("role") == "tool" and "chunks" in message.data.get("additional_kwargs", {})]
+    texts = {}
+    current = []
+    for message in compact:
+        # chunk ids of another chunking point to different text: never rebuild from the current index
+        if is_stale_tool_message(message):
+            texts[str(message.message_id)] = STALE_TOOL_RESULTS_TEXT
+        else:
+            current.append(message)
+    chunk_ids = {chunk["id"] for message in current for chunk in message.data["additional_kwargs"]["chunks"]}
+    if not chunk_ids:
+        return texts
+
+    chunk_store = get_chunks(list(chunk_ids))
+    for message in current:
+        additional_kwargs = message.data["additional_kwargs"]
+        search_results = [dict(chunk_store[chunk["id"]], similarity=chunk["score"])
+                          for chunk in additional_kwargs["chunks"] if chunk["id"] in chunk_store]
+        texts[str(message.message_id)] = format_tool_results(search_results)
+    return texts
+
+
+def tool_cache_key(tool_name: str, tool_kwargs: dict) -> str:
+    """Key identifying a tool call by its normalized arguments, used to reuse results within a session."""
+    normalized = {}
+    for name, value in tool_kwargs.items():
+        if isinstance(value, str):
+            # case, punctuation and spacing only: every word (question words included) changes the meaning
+            value = " ".join(re.findall(r"\w+", value.lower()))
+        normalized[name] = value
+    return f"{tool_name}:{json.dumps(normalized, sort_keys=True, default=str)}"
+
+
+def _cached_tool_text(tool_name: str, message_id) -> str:
+    return f"Same results as the earlier {tool_name} call (message {message_id}) above."
+
+
+def _history_chat_message(message: conversation_models.Message, tool_texts: Dict[str, str],
+                          window_ids: set) -> ChatMessage:
+    """ChatMessage sent to the LLM for a stored message, with tool results expanded to their text."""
+    if message.data.get("role") != "tool":
+        return ChatMessage(**message.data)
+
+    additional_kwargs = message.data.get("additional_kwargs", {})
+    cached_from = additional_kwargs.get("cached_from")
+    if cached_from and cached_from in window_ids:
+        text = _cached_tool_text(additional_kwargs.get("tool_name"), cached_from)
+    elif str(message.message_id) in tool_texts:
+        text = tool_texts[str(message.message_id)]
+    else:
+        # tool messages stored with their full text
+        return ChatMessage(**message.data)
+    return ChatMessage(**dict(message.data, blocks=[{"block_type": "text", "text": text}]))
+
+
+@traced()
+async def ask_agent_v1(turn: conversation_crud.ChatTurn, history: List[conversation_models.Message]):
+    search_user_id.set(turn.session.user_id)
+    timings = []
+    started = time.perf_counter()
+    deadline = started + server_settings.AGENT_DEADLINE_SECONDS
+
+    # Condense older turns into the stored summary once the session grows past the threshold
+    summary, conversation = split_summarized(history)
+    try:
+        # at most half of the turn's budget, the rest is left to answer
+        summary, conversation = await _before_deadline((started + deadline) / 2,
+                                                       update_summary(turn, summary, conversation))
+    except asyncio.TimeoutError:
+        # the turn goes on with the unsummarized history, the next turn summarizes it
+        logger.warning(f"Summarizing session {turn.session_id} ran past the turn deadline, skipped")
+
+    # Replay the summary and the recent history that fits next to the system prompt in the context window
+    budget = history_token_budget(simple_system_prompt)
     messages = []
-    for message in session.messages:
-        current_message = ChatMessage(
-            **message.data
-        )
+    if summary is not None:
+        messages.append(summary_chat_message(summary))
+        budget -= message_tokens(summary)
+    selected = select_history(conversation, max(0, budget))
+    # ids of the stored messages the LLM can see, to reference earlier tool results
+    window_ids = {str(message.message_id) for message in selected}
+    # Tool messages only store chunk ids: load their text from the chunk store (off the event loop)
+    tool_texts = await asyncio.to_thread(rehydrate_tool_messages, [
+        message for message in selected
+        if message.data.get("additional_kwargs", {}).get("cached_from") not in window_ids
+    ])
+    for message in selected:
+        current_message = _history_chat_message(message, tool_texts, window_ids)
         messages.append(current_message)
 
-    model = Ollama(
-        model="qwen3:8b",  # local model name qwen3:8b
-        request_timeout=360.0,
-        # Manually set the context window to limit memory usage
-        context_window=8000,
-        thinking=True
-    )
+    model = get_llm(server_settings.AGENT_MODEL, thinking=True)  # local model name qwen3:8b
 
     tool = FunctionTool.from_defaults(fn=search_documents_v1)
+    tools_by_name = {tool.metadata.name: tool}
 
     # Call llm with initial tools + chat history + system_prompt
-    response = await model.achat_with_tools(tools=[tool], chat_history=messages,
-                                            system_prompt=simple_system_prompt)
-
-    # Parse tool calls from response
-    tool_calls = model.get_tool_calls_from_response(
-        response, error_on_no_tool_call=False
-    )
+    # set once a step runs past the deadline: the model answers with the results it already has
+    timed_out = False
+
+    step_started = time.perf_counter()
+    try:
+        with span("llm.chat_with_tools", model=server_settings.AGENT_MODEL, messages=len(messages)) as llm_span:
+            response = await _before_deadline(deadline, model.achat_with_tools(tools=[tool], chat_history=messages,
+                                                                               system_prompt=simple_system_prompt))
+            annotate_llm_span(llm_span, response)
+        record_llm_usage(server_settings.AGENT_MODEL, response)
+        # Parse tool calls from response
+        tool_calls = model.get_tool_calls_from_response(
+            response, error_on_no_tool_call=False
+        )
+    except asyncio.TimeoutError:
+        timed_out, tool_calls = True, []
+    timings.append(("llm", time.perf_counter() - step_started))
+
+    iterations = 0
+    while tool_calls and not timed_out:
+        if iterations >= server_settings.AGENT_MAX_ITERATIONS or time.perf_counter() > deadline:
+            break
+        iterations += 1
+
+        # Store agent response (tool call message) and add it to the chat history
+        message = turn.add_message(data=response.message.model_dump())
+        messages.append(ChatMessage(
+            **message.data
+        ))
+
+        # Reuse the results of identical (normalized) calls made earlier in the session
+        cache_keys = [tool_cache_key(tool_call.tool_name, tool_call.tool_kwargs) for tool_call in tool_calls]
+        cached = await conversation_crud.get_tool_messages_by_cache_key(turn.db, turn.session_id, set(cache_keys))
+        # results of another index version are not reused, the call runs again
+        cached = {cache_key: message for cache_key, message in cached.items() if not is_stale_tool_message(message)}
+        pending = {}
+        for cache_key, tool_call in zip(cache_keys, tool_calls):
+            # a call repeated within this response reuses the results of the first one
+            if cache_key in cached or cache_key in pending:
+                cache_hits.inc(cache="tool_results")
+            else:
+                cache_misses.inc(cache="tool_results")
+                pending[cache_key] = tool_call
+
+        # Run the remaining tool calls of this turn concurrently, off the event loop
+        step_started = time.perf_counter()
+        try:
+            with span("agent.tools", requested=len(tool_calls), pending=len(pending)):
+                tool_outputs = await _before_deadline(deadline, asyncio.gather(
+                    *(asyncio.to_thread(_call_tool, tools_by_name, tool_call) for tool_call in pending.values())
+                ))
+        except asyncio.TimeoutError:
+            # the threads of hung calls are left behind, their calls are answered with an error
+            timed_out = True
+            tool_outputs = [f"Error: {tool_call.tool_name} timed out" for tool_call in pending.values()]
+        timings.append((f"tools[{len(pending)}/{len(tool_calls)}]", time.perf_counter() - step_started))
+        results = dict(zip(pending.keys(), tool_outputs))
+
+        for cache_key, tool_call in zip(cache_keys, tool_calls):
+            additional_kwargs = {"tool_call_id": tool_call.tool_id, "tool_name": tool_call.tool_name,
+                                 "cache_key": cache_key}
+            earlier = cached.get(cache_key)
+            tokens = None
+            if earlier is None:
+                output = results[cache_key]
+                if isinstance(output, str):
+                    # failed calls are not reused
+                    del additional_kwargs["cache_key"]
+                    tool_text = output
+                else:
+                    additional_kwargs.update(compact_tool_results(output))
+                    # packing tokenizes every result: off the event loop
+                    tool_text = await asyncio.to_thread(format_tool_results, output)
+            else:
+                earlier_kwargs = earlier.data["additional_kwargs"]
+                additional_kwargs["cached_from"] = str(earlier.message_id)
+                if "chunks" in earlier_kwargs:
+                    additional_kwargs.update(chunks=earlier_kwargs["chunks"],
+                                             index_version=earlier_kwargs.get("index_version"))
+                    tokens = earlier.tokens
+                if str(earlier.message_id) in window_ids:
+                    tool_text = _cached_tool_text(tool_call.tool_name, earlier.message_id)
+                else:
+                    rehydrated = await asyncio.to_thread(rehydrate_tool_messages, [earlier])
+                    tool_text = rehydrated.get(str(earlier.message_id)) or earlier.data["blocks"][0]["text"]
+                logger.info(f"Reusing {tool_call.tool_name} results of message {earlier.message_id}")
+
+            # Compact results are stored as chunk references, their text is rebuilt when needed
+            stored_text = tool_text
+            if "chunks" in additional_kwargs:
+                stored_text = f"{len(additional_kwargs['chunks'])} document chunks retrieved"
+            tool_md = conversation_models.MessageData(
+                role="tool",
+                additional_kwargs=additional_kwargs,
+                blocks=[{"block_type": "text", "text": stored_text}],
+            )
+            if tokens is None:
+                # count what is actually sent to the LLM, not the stored reference
+                tokens = await asyncio.to_thread(count_message_tokens,
+                                                 {"blocks": [{"block_type": "text", "text": tool_text}]})
 
-    # check if the tool call needed
-    if not tool_calls:
-        return response
-    else:
-        while tool_calls:
-            # Add the LLM's response (tool call message) to the chat history
-            # print("response", response.model_dump())
-            # print("response.message", response.message.model_dump())
-
-            # Store agent response
-            message = conversation_crud.add_message(db, session.session_id, data=response.message.model_dump(),
-                                                    tokens=None,
-                                                    )
+            # Store Tool response
+            message = turn.add_message(data=tool_md.model_dump(), tokens=tokens)
             messages.append(ChatMessage(
-                **message.data
+                **dict(message.data, blocks=[{"block_type": "text", "text": tool_text}])
             ))
-
-            for tool_call in tool_calls:
-                tool_name = tool_call.tool_name
-                tool_kwargs = tool_call.tool_kwargs
-
-                logger.info(f"Calling {tool_name} with {tool_kwargs}")
-                search_results = tool.call(**tool_kwargs).raw_output
-                texts = []
-                for result in search_results:
-                    texts.append(
-                        {"id": result["id"], "content": result["content"], "title": result["metadata"]["title"]})
-
-                tool_md = conversation_models.MessageData(
-                    role="tool",
-                    additional_kwargs={"tool_call_id": tool_call.tool_id},
-                    blocks=[{"block_type": "text", "text": str(texts)}],
-                )
-
-                # Store Tool response
-                message = conversation_crud.add_message(db, session.session_id, data=tool_md.model_dump(),
-                                                        tokens=None,
-                                                        )
-                messages.append(ChatMessage(
-                    **message.data
-                ))
-
-                # check if the LLM can write a final response or calls more tools
-                response = await model.achat_with_tools([tool], chat_history=messages,
-                                                        system_prompt=simple_system_prompt)
-                tool_calls = model.get_tool_calls_from_response(
-                    response, error_on_no_tool_call=False
-                )
-        return response
-        # resp.message.content
+            window_ids.add(str(message.message_id))
+            if "chunks" in additional_kwargs:
+                # stored as provenance with the messages of the turn
+                if earlier is None:
+                    turn.attach_retrieved_docs(message.message_id, output)
+                else:
+                    # replayed results: same chunks as the earlier message
+                    turn.copy_retrieved_docs(message.message_id, earlier.message_id)
+            # a repeated call within the same turn references this message
+            if earlier is None and "cache_key" in additional_kwargs:
+                cached[cache_key] = message
+
+        if timed_out:
+            break
+
+        # One follow-up call with all the tool results: final response or more tool calls
+        step_started = time.perf_counter()
+        try:
+            with span("llm.chat_with_tools", model=server_settings.AGENT_MODEL, messages=len(messages)) as llm_span:
+                response = await _before_deadline(deadline, model.achat_with_tools([tool], chat_history=messages,
+                                                                                   system_prompt=simple_system_prompt))
+                annotate_llm_span(llm_span, response)
+            record_llm_usage(server_settings.AGENT_MODEL, response)
+            tool_calls = model.get_tool_calls_from_response(
+                response, error_on_no_tool_call=False
+            )
+        except asyncio.TimeoutError:
+            timed_out = True
+        timings.append(("llm", time.perf_counter() - step_started))
+
+    if tool_calls or timed_out:
+        # Stop looping on tools and let the model answer with the results it already has
+        # (this last call is bounded by the LLM client's request timeout)
+        logger.warning(f"Agent stopped after {iterations} tool iterations "
+                       f"({time.perf_counter() - started:.1f}s{', deadline exceeded' if timed_out else ''}), "
+                       f"asking for a final answer")
+        step_started = time.perf_counter()
+        with span("llm.chat", model=server_settings.AGENT_MODEL, messages=len(messages)) as llm_span:
+            response = await model.achat(
+                messages=[ChatMessage(role="system", content=simple_system_prompt), *messages]
+            )
+            annotate_llm_span(llm_span, response)
+        timings.append(("llm_final", time.perf_counter() - step_started))
+        record_llm_usage(server_settings.AGENT_MODEL, response)
+
+    timings.append(("total", time.perf_counter() - started))
+    endpoint = current_endpoint.get()
+    for name, seconds in timings:
+        # tools[pending/requested] -> tools
+        stage = "agent_" + ("turn" if name == "total" else name.split("[")[0])
+        model_name = server_settings.AGENT_MODEL if name.startswith("llm") else ""
+        stage_duration.observe(seconds, stage=stage, endpoint=endpoint, model=model_name)
+    logger.info("Agent turn timings: " + ", ".join(f"{name}={seconds:.2f}s" for name, seconds in timings))
+    response.additional_kwargs["timings"] = timings
+    return response
 
     # response = await model.achat(messages=messages, tools=[], system_prompt=system_prompt)
     # return response
@@ -0,0 +1,197 @@
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from llama_index.core.llms import ChatMessage
+
+from app.core.config import settings as server_settings
+from app.core.metrics import stage_timer, record_llm_usage
+from app.core.tracing import annotate_llm_span, span, traced
+from app.models.conversation_models import Message, MessageData, SUMMARY_KEY
+from app.services.conversation_crud import ChatTurn
+from app.services.llm_service import get_llm
+from app.utils.logger import logger
+from app.utils.token_utils import count_tokens, estimate_message_tokens, message_text
+
+
+# ========================================
+# SECTION 8: CHAT HISTORY WINDOWING
+# ========================================
+
+@lru_cache(maxsize=16)
+def _prompt_tokens(prompt: str, model: str) -> int:
+    return count_tokens(prompt, model)
+
+
+def history_token_budget(system_prompt: str, model: str = None) -> int:
+    """Tokens left for chat history once the system prompt and the answer are reserved."""
+    model = model or server_settings.AGENT_MODEL
+    available = (server_settings.LLM_CONTEXT_WINDOW
+                 - _prompt_tokens(system_prompt, model)
+                 - server_settings.AGENT_RESPONSE_TOKEN_RESERVE)
+    return max(0, min(server_settings.AGENT_HISTORY_TOKEN_BUDGET, available))
+
+
+def message_tokens(message: Message) -> int:
+    # Messages stored before token accounting have no count, estimate them instead of re-tokenizing
+    return message.tokens if message.tokens is not None else estimate_message_tokens(message.data)
+
+
+def _is_tool_exchange(message: Message) -> bool:
+    """Tool results and the assistant messages that requested them."""
+    role = message.data.get("role")
+    return role == "tool" or (role == "assistant" and bool(message.data.get("additional_kwargs", {}).get("tool_calls")))
+
+
+def _split_turns(messages: List[Message]) -> List[List[Message]]:
+    """Group an ascending list of messages into turns, each one starting at a user message."""
+    turns = []
+    for message in messages:
+        if not turns or message.data.get("role") == "user":
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def select_history(messages: List[Message], token_budget: int) -> List[Message]:
+    """
+    Select the chat history sent to the agent within a token budget.
+
+    This section demonstrates:
+    - Using the token counts stored with each message (no re-tokenization)
+    - Keeping the most recent turns complete, including their tool results
+    - Dropping the tool exchanges of older turns before dropping the turns themselves
+    """
+    turns = _split_turns(messages)
+    selected = []
+    used_tokens = 0
+    for position, turn in enumerate(reversed(turns)):
+        full_tokens = sum(message_tokens(message) for message in turn)
+        # the latest turn holds the current question, it is always sent
+        if position == 0 or used_tokens + full_tokens <= token_budget:
+            selected.append(turn)
+            used_tokens += full_tokens
+            continue
+
+        compact = [message for message in turn if not _is_tool_exchange(message)]
+        compact_tokens = sum(message_tokens(message) for message in compact)
+        if compact and used_tokens + compact_tokens <= token_budget:
+            selected.append(compact)
+            used_tokens += compact_tokens
+            continue
+        # older turns are only useful contiguous with the recent ones
+        break
+
+    history = [message for turn in reversed(selected) for message in turn]
+    logger.debug(f"Selected {len(history)}/{len(messages)} messages of history ({used_tokens}/{token_budget} tokens)")
+    return history
+
+
+# ========================================
+# SECTION 9: ROLLING SUMMARIZATION
+# ========================================
+
+summary_prompt = """
+You maintain a running summary of a conversation between a user and a research assistant.
+Update the current summary with the new messages below.
+Keep facts, names, dates, the user's goals and any open questions; drop greetings and repetition.
+Answer with the updated summary only, in at most {max_words} words.
+
+CURRENT SUMMARY:
+{summary}
+
+NEW MESSAGES:
+{messages}
+"""
+
+
+def is_summary(message: Message) -> bool:
+    return SUMMARY_KEY in message.data.get("additional_kwargs", {})
+
+
+def split_summarized(messages: List[Message]) -> Tuple[Optional[Message], List[Message]]:
+    """Return the latest summary of a session and the messages it doesn't cover yet."""
+    summary = None
+    conversation = []
+    for message in messages:
+        if is_summary(message):
+            summary = message
+        else:
+            conversation.append(message)
+
+    if summary is not None:
+        until_id = summary.data["additional_kwargs"][SUMMARY_KEY]["until_id"]
+        ids = [str(message.message_id) for message in conversation]
+        if until_id in ids:
+            conversation = conversation[ids.index(until_id) + 1:]
+    return summary, conversation
+
+
+def summary_chat_message(summary: Message) -> ChatMessage:
+    return ChatMessage(role="system", content=f"Summary of the earlier conversation:\n{message_text(summary.data)}")
+
+
+def _transcript(messages: List[Message], max_chars: int = 600) -> str:
+    lines = []
+    for message in messages:
+        text = message_text(message.data).strip()
+        if not text:
+            continue
+        # tool results are long and mostly quoted sources, keep only their beginning
+        if message.data.get("role") == "tool" and len(text) > max_chars:
+            text = text[:max_chars] + "..."
+        lines.append(f"{message.data.get('role')}: {text}")
+    return "\n".join(lines)
+
+
+@traced()
+async def summarize_messages(previous_summary: str, messages: List[Message]) -> str:
+    model = get_llm(server_settings.LLM_MODEL, num_predict=server_settings.SUMMARY_MAX_TOKENS)
+    prompt = summary_prompt.format(
+        max_words=int(server_settings.SUMMARY_MAX_TOKENS * 0.7),
+        summary=previous_summary or "(empty)",
+        messages=_transcript(messages),
+    )
+    with span("llm.chat", model=server_settings.LLM_MODEL) as llm_span:
+        response = await model.achat(messages=[ChatMessage(role="user", content=prompt)])
+        annotate_llm_span(llm_span, response)
+    record_llm_usage(server_settings.LLM_MODEL, response)
+    return (response.message.content or "").strip()
+
+
+async def update_summary(turn: ChatTurn, summary: Optional[Message],
+                         conversation: List[Message]) -> Tuple[Optional[Message], List[Message]]:
+    """
+    Condense the older turns of a long session into a persisted summary message.
+
+    This section demonstrates:
+    - Triggering on the stored token total of the unsummarized messages
+    - Summarizing only the delta since the previous summary (bounded cost per turn)
+    - Keeping the most recent turns verbatim
+    """
+    total_tokens = sum(message_tokens(message) for message in conversation)
+    if total_tokens <= server_settings.SUMMARY_TRIGGER_TOKENS:
+        return summary, conversation
+
+    turns = _split_turns(conversation)
+    keep = max(1, server_settings.SUMMARY_KEEP_RECENT_TURNS)
+    if len(turns) <= keep:
+        return summary, conversation
+    delta = [message for turn in turns[:-keep] for message in turn]
+    recent = [message for turn in turns[-keep:] for message in turn]
+
+    previous_text = message_text(summary.data) if summary is not None else ""
+    with stage_timer("summarize", model=server_settings.LLM_MODEL):
+        summary_text = await summarize_messages(previous_text, delta)
+    if not summary_text:
+        return summary, conversation
+
+    last = delta[-1]
+    summary_md = MessageData(
+        role="system",
+        additional_kwargs={SUMMARY_KEY: {"until_id": str(last.message_id),
+                                         "until_created_at": last.created_at.isoformat()}},
+        blocks=[{"block_type": "text", "text": summary_text}],
+    )
+    new_summary = turn.add_message(data=summary_md.model_dump())
+    logger.info(f"Summarized {len(delta)} messages ({total_tokens} tokens pending) of session {turn.session_id}")
+    return new_summary, recent
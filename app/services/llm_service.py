@@ -0,0 +1,26 @@
+from functools import lru_cache
+from typing import Optional
+
+from app.core.config import settings as server_settings
+
+
+@lru_cache(maxsize=8)
+def get_llm(model: str, thinking: Optional[bool] = None, num_predict: Optional[int] = None):
+    """
+    Shared Ollama client of a model, created on first use.
+
+    The client (and its HTTP connection pool) is reused across requests, and llama_index
+    is only imported once an LLM is actually needed, not when the app starts.
+    """
+    from llama_index.llms.ollama import Ollama
+
+    additional_kwargs = {"num_predict": num_predict} if num_predict is not None else {}
+    return Ollama(
+        model=model,  # local model name
+        base_url=server_settings.OLLAMA_BASE_URL,
+        request_timeout=360.0,
+        # Manually set the context window to limit memory usage
+        context_window=server_settings.LLM_CONTEXT_WINDOW,
+        thinking=thinking,
+        additional_kwargs=additional_kwargs,
+    )
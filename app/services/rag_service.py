@@ -6,6 +6,7 @@ from app.services.embedding_service import setup_vector_database, process_user_q
 from app.services.retriever_service import search_vector_database
 from app.services.generator_service import augment_prompt_with_context, generate_response
 from app.core.config import settings as server_settings
+from app.core.metrics import stage_timer
 
 DATA_DIR = server_settings.DATA_DIR
 
@@ -23,21 +24,27 @@ def run_complete_rag_pipeline(query: str):
     6. Response generation
     """
     # Step 1: Load and chunk documents
-    chunks = load_and_chunk_documents(DATA_DIR)
+    with stage_timer("chunk"):
+        chunks = load_and_chunk_documents(DATA_DIR)
 
     # Step 2: Setup vector database
-    collection = setup_vector_database(chunks)
+    with stage_timer("upsert"):
+        collection = setup_vector_database(chunks)
 
     # Step 3: Process user query
-    _, query_embedding = process_user_query(query)
+    with stage_timer("embed_query", model=server_settings.EMBEDDING_MODEL):
+        _, query_embedding = process_user_query(query)
 
     # Step 4: Search vector database
-    search_results = search_vector_database(collection, query_embedding, top_k=3)
+    with stage_timer("vector_search"):
+        search_results = search_vector_database(collection, query_embedding, top_k=3)
 
     # Step 5: Augment prompt with context
-    augmented_prompt = augment_prompt_with_context(query, search_results)
+    with stage_timer("prompt_build"):
+        augmented_prompt = augment_prompt_with_context(query, search_results)
 
     # Step 6: Generate response
-    response = generate_response(augmented_prompt)
+    with stage_timer("llm_generate", model=server_settings.LLM_MODEL):
+        response = generate_response(augmented_prompt)
 
     return response
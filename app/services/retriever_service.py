@@ -1,15 +1,37 @@
-import chromadb
-from chromadb.config import Settings
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import List, Dict
+from uuid import UUID
 
 from app.core.config import settings as server_settings
-from app.services.embedding_service import load_and_chunk_documents, setup_vector_database, process_user_query
+from app.core.metrics import stage_timer
+from app.core.tracing import current_span, traced
+from app.services.embedding_service import load_and_chunk_documents, setup_vector_database, process_user_query, \
+    get_or_create_collection, get_chroma_client, user_collection_name
 
 
 # ========================================
 # SECTION 4: VECTOR SEARCH
 # ========================================
 
-def search_vector_database(collection, query_embedding, top_k: int = 3):
+def resolve_ef_search(profile: str = None, ef_search: int = None) -> int:
+    """ef_search of a search: explicit value first, then the named profile, then the default profile."""
+    if ef_search is not None:
+        return ef_search
+    profile = profile or server_settings.SEARCH_DEFAULT_PROFILE
+    if profile not in server_settings.SEARCH_PROFILES:
+        raise ValueError(f"Unknown search profile {profile!r}, expected one of {list(server_settings.SEARCH_PROFILES)}")
+    return server_settings.SEARCH_PROFILES[profile]
+
+
+def _collection_ef_search(collection) -> int:
+    hnsw = (collection.configuration or {}).get("hnsw") or {}
+    return hnsw.get("ef_search") or 0
+
+
+@traced()
+def search_vector_database(collection, query_embedding, top_k: int = 3, ef_search: int = None):
     """
     Search vector database for relevant document chunks.
 
@@ -18,23 +40,39 @@ def search_vector_database(collection, query_embedding, top_k: int = 3):
     - Result ranking and filtering
     - Similarity scoring
     - Top-k result selection
+    - Per-request HNSW ef_search (latency vs recall)
     """
+    # HNSW explores max(ef_search of the index, n_results) candidates: a larger ef_search than the
+    # index's one is applied by asking for that many neighbours and keeping the top_k. Changing the
+    # index's ef_search instead (collection.modify) is shared by all requests and, with Chroma's
+    # local client, only applies once the collection is reloaded.
+    ef_search = ef_search or resolve_ef_search()
+    n_results = max(top_k, ef_search) if ef_search > _collection_ef_search(collection) else top_k
+    span = current_span()
+    if span is not None:
+        span.set(top_k=top_k, ef_search=ef_search, n_results=n_results)
+
     # Perform vector search
-    results = collection.query(
-        query_embeddings=[query_embedding.tolist()],
-        n_results=top_k,  # How many results are returned?
-    )
+    if n_results == top_k:
+        results = collection.query(
+            query_embeddings=[query_embedding.tolist()],
+            n_results=top_k,  # How many results are returned?
+        )
+        ids, distances = results["ids"][0], results["distances"][0]
+        documents, metadatas = results["documents"][0], results["metadatas"][0]
+    else:
+        # candidates by distance only, then the documents of the top_k
+        results = collection.query(query_embeddings=[query_embedding.tolist()], n_results=n_results,
+                                   include=["distances"])
+        ids, distances = results["ids"][0][:top_k], results["distances"][0][:top_k]
+        stored = collection.get(ids=ids, include=["documents", "metadatas"])
+        by_id = dict(zip(stored["ids"], zip(stored["documents"], stored["metadatas"])))
+        documents = [by_id[doc_id][0] for doc_id in ids]
+        metadatas = [by_id[doc_id][1] for doc_id in ids]
 
     # Process and display results
     search_results = []
-    for i, (doc_id, distance, content, metadata) in enumerate(
-            zip(
-                results["ids"][0],
-                results["distances"][0],
-                results["documents"][0],
-                results["metadatas"][0],
-            )
-    ):
+    for i, (doc_id, distance, content, metadata) in enumerate(zip(ids, distances, documents, metadatas)):
         similarity = 1 - distance  # Convert distance to similarity
         search_results.append(
             {
@@ -48,7 +86,82 @@ def search_vector_database(collection, query_embedding, top_k: int = 3):
     return search_results
 
 
-def search_query_pipline(query: str):
+def get_collection(name: str = None):
+    """Open a ChromaDB collection holding document chunks, the shared corpus by default."""
+    return get_or_create_collection(name or server_settings.COLLECTION_NAME)
+
+
+def get_user_collection(user_id: UUID):
+    """Collection of the documents uploaded by a user, None if the user has not uploaded any."""
+    from chromadb.errors import NotFoundError
+
+    try:
+        return get_chroma_client().get_collection(user_collection_name(user_id))
+    except NotFoundError:
+        return None
+
+
+def collection_of_chunk(chunk_id: str) -> str:
+    """Collection of a chunk: uploaded chunks are prefixed with their collection name, see `index_user_document`."""
+    prefix = chunk_id.split("/", 1)[0]
+    if prefix.startswith(server_settings.USER_COLLECTION_PREFIX) and "/" in chunk_id:
+        return prefix
+    return server_settings.COLLECTION_NAME
+
+
+@traced()
+def get_chunks(chunk_ids: List[str]) -> Dict[str, Dict]:
+    """Fetch stored chunks by id from the vector store (no embedding / search involved)."""
+    if not chunk_ids:
+        return {}
+    by_collection = defaultdict(list)
+    for chunk_id in set(chunk_ids):
+        by_collection[collection_of_chunk(chunk_id)].append(chunk_id)
+
+    chunks = {}
+    for collection_name, ids in by_collection.items():
+        results = get_collection(collection_name).get(ids=ids, include=["documents", "metadatas"])
+        chunks.update({
+            chunk_id: {"id": chunk_id, "content": content, "metadata": metadata}
+            for chunk_id, content, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+        })
+    return chunks
+
+
+# Threads searching the collections of one query concurrently
+_fanout_pool = ThreadPoolExecutor(max_workers=server_settings.SEARCH_FANOUT_WORKERS,
+                                  thread_name_prefix="search-fanout")
+
+
+@traced()
+def search_collections(collections: List, query_embedding, top_k: int = 3, ef_search: int = None) -> List[Dict]:
+    """
+    Search several collections for one query and merge their results.
+
+    This section demonstrates:
+    - Fan-out: the collections are searched concurrently (one query embedding for all)
+    - Merge by similarity, keeping the overall top_k
+    """
+    if len(collections) == 1:
+        per_collection = [search_vector_database(collections[0], query_embedding, top_k, ef_search)]
+    else:
+        # each search runs in a copy of the caller's context (tracing spans, metrics labels)
+        futures = [_fanout_pool.submit(copy_context().run, search_vector_database, collection, query_embedding,
+                                       top_k, ef_search)
+                   for collection in collections]
+        per_collection = [future.result() for future in futures]
+
+    merged = []
+    for collection, results in zip(collections, per_collection):
+        for result in results:
+            result["metadata"] = dict(result["metadata"] or {}, collection=collection.name)
+            merged.append(result)
+    merged.sort(key=lambda result: result["similarity"], reverse=True)
+    return merged[:top_k]
+
+
+@traced()
+def search_query_pipline(query: str, top_k: int = 3, ef_search: int = None, user_id: UUID = None):
     """
     Get ChromaDB collection database and search for most related documents.
 
@@ -56,14 +169,11 @@ def search_query_pipline(query: str):
     - ChromaDB client initialization
     - Collection initialization
     - query embedding
-    - Vector search
+    - Vector search (ef_search: see `search_vector_database`), over the shared corpus and,
+      for a user, the user's own uploads
     """
-    # Initialize ChromaDB client
-    chroma_client = chromadb.PersistentClient("vector_db/chroma", settings=Settings(anonymized_telemetry=False))
-
-    # Create collection (what is the collection name? | What similarity metric is used? | embedding_functions)
-    collection = chroma_client.get_or_create_collection(name="wiki_articles_v1", metadata={
-        "hnsw:space": "cosine"}, )
+    # Initialize ChromaDB client and collection
+    collection = get_collection()
 
     # index documents if they are not indexed before
     if collection.count() == 0:
@@ -73,9 +183,16 @@ def search_query_pipline(query: str):
         # Step 2: Setup vector database client
         _ = setup_vector_database(chunks)
 
+    collections = [collection]
+    user_collection = get_user_collection(user_id) if user_id is not None else None
+    if user_collection is not None:
+        collections.append(user_collection)
+
     # Step 3: Process user query
-    _, query_embedding = process_user_query(query)
+    with stage_timer("embed_query", model=server_settings.EMBEDDING_MODEL):
+        _, query_embedding = process_user_query(query)
 
     # Step 4: Search vector database
-    search_results = search_vector_database(collection, query_embedding, top_k=3)
+    with stage_timer("vector_search"):
+        search_results = search_collections(collections, query_embedding, top_k=top_k, ef_search=ef_search)
     return search_results
@@ -0,0 +1,197 @@
+import multiprocessing
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from app.core.config import settings as server_settings
+from app.utils.logger import logger
+
+
+# ========================================
+# SECTION 2.2: SHARDED VECTOR INDEX
+# ========================================
+
+def shard_of(chunk_id: str, shards: int) -> int:
+    """Shard holding a chunk: a stable hash of its id (unlike `hash`, the same in every process)."""
+    return zlib.crc32(chunk_id.encode("utf-8")) % shards
+
+
+def shard_path(shard: int, shards: int) -> str:
+    # the partitioning depends on the shard count, each count has its own stores
+    return f"{server_settings.VECTOR_DB_PATH}-shard{shard}of{shards}"
+
+
+def _serve_shard(conn, shard: int, shards: int):
+    """
+    Main loop of a shard process: one Chroma store holding the chunks of this shard.
+
+    Requests are (operation, args) tuples, answered with ("ok", result) or ("error", message).
+    """
+    # the shard holds a plain (unsharded) collection in its own store
+    server_settings.VECTOR_DB_PATH = shard_path(shard, shards)
+    server_settings.VECTOR_SHARDS = 1
+    from app.services.embedding_service import get_or_create_collection
+
+    collection = get_or_create_collection(server_settings.COLLECTION_NAME)
+    conn.send(("ok", collection.count()))
+    while True:
+        try:
+            operation, args = conn.recv()
+        except EOFError:
+            # the app process is gone
+            break
+        if operation == "stop":
+            break
+        try:
+            conn.send(("ok", getattr(collection, operation)(**args)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+class Shard:
+    """A shard process and the pipe to it, one request in flight at a time."""
+
+    def __init__(self, shard: int, shards: int):
+        # spawned, not forked: the app process runs threads (pools, event loop)
+        context = multiprocessing.get_context("spawn")
+        self.shard = shard
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve_shard, args=(child_conn, shard, shards),
+                                       name=f"vector-shard-{shard}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self._lock = threading.Lock()
+        self.count = self._receive()
+
+    def _receive(self):
+        status, result = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Vector shard {self.shard}: {result}")
+        return result
+
+    def call(self, operation: str, **args):
+        with self._lock:
+            self.conn.send((operation, args))
+            return self._receive()
+
+    def stop(self):
+        with self._lock:
+            try:
+                self.conn.send(("stop", None))
+            except OSError:
+                pass
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class ShardedCollection:
+    """
+    The shared corpus spread over local shard processes, with the part of Chroma's collection
+    API the app uses (upsert, get, query, count), so indexing and search code is unchanged.
+
+    This section demonstrates:
+    - Hash-partitioning the chunks by id: each shard indexes and embeds only its own chunks
+    - Scatter-gather: a query goes to every shard over IPC, their top n_results are merged
+    - Index size and HNSW search spread over processes (one GIL and one index per shard)
+    """
+
+    def __init__(self, name: str, shards: int):
+        self.name = name
+        self.shards = shards
+        # shards start concurrently, each one opens (loads) its index
+        with ThreadPoolExecutor(max_workers=shards) as starter:
+            self._shards = list(starter.map(lambda shard: Shard(shard, shards), range(shards)))
+        self._pool = ThreadPoolExecutor(max_workers=shards, thread_name_prefix="vector-shard")
+        logger.info(f"Started {shards} vector shards of {name} "
+                    f"({sum(shard.count for shard in self._shards)} chunks)")
+
+    @property
+    def configuration(self) -> Dict:
+        from app.services.embedding_service import hnsw_configuration
+
+        # every shard is created with the configuration of the collection
+        return {"hnsw": hnsw_configuration(self.name)}
+
+    def _scatter(self, requests: Dict[int, tuple]) -> Dict[int, object]:
+        """Send one request to each given shard concurrently, results by shard."""
+        futures = {shard: self._pool.submit(self._shards[shard].call, operation, **args)
+                   for shard, (operation, args) in requests.items()}
+        return {shard: future.result() for shard, future in futures.items()}
+
+    def _by_shard(self, ids: List[str]) -> Dict[int, List[int]]:
+        positions: Dict[int, List[int]] = {}
+        for position, chunk_id in enumerate(ids):
+            positions.setdefault(shard_of(chunk_id, self.shards), []).append(position)
+        return positions
+
+    def count(self) -> int:
+        return sum(self._scatter({shard: ("count", {}) for shard in range(self.shards)}).values())
+
+    def upsert(self, ids: List[str], **fields):
+        # documents, metadatas, embeddings: split along with their ids
+        requests = {
+            shard: ("upsert", {"ids": [ids[i] for i in positions],
+                               **{field: [values[i] for i in positions]
+                                  for field, values in fields.items() if values is not None}})
+            for shard, positions in self._by_shard(ids).items()
+        }
+        self._scatter(requests)
+
+    def get(self, ids: List[str], include: List[str] = None) -> Dict:
+        include = include or ["documents", "metadatas"]
+        requests = {shard: ("get", {"ids": [ids[i] for i in positions], "include": include})
+                    for shard, positions in self._by_shard(ids).items()}
+        merged = {"ids": [], **{field: [] for field in include}}
+        for result in self._scatter(requests).values():
+            merged["ids"].extend(result["ids"])
+            for field in include:
+                merged[field].extend(result[field])
+        return merged
+
+    def query(self, query_embeddings: List, n_results: int = 10, include: List[str] = None) -> Dict:
+        include = include or ["metadatas", "documents", "distances"]
+        # distances are needed to merge, even when not asked for
+        fields = ["ids", "distances", *(field for field in include if field != "distances")]
+        # the global top n_results are among the top n_results of each shard
+        request = ("query", {"query_embeddings": query_embeddings, "n_results": n_results, "include": fields[1:]})
+        per_shard = list(self._scatter({shard: request for shard in range(self.shards)}).values())
+
+        merged = {field: [] for field in fields}
+        for query in range(len(query_embeddings)):
+            rows = [tuple(result[field][query][i] for field in fields)
+                    for result in per_shard for i in range(len(result["ids"][query]))]
+            rows.sort(key=lambda row: row[1])
+            rows = rows[:n_results]
+            for position, field in enumerate(fields):
+                merged[field].append([row[position] for row in rows])
+        return merged
+
+    def stop(self):
+        for shard in self._shards:
+            shard.stop()
+        self._pool.shutdown(wait=False)
+
+
+_sharded_collection: Optional[ShardedCollection] = None
+_sharded_lock = threading.Lock()
+
+
+def get_sharded_collection() -> ShardedCollection:
+    """The shared corpus over VECTOR_SHARDS shard processes, started on first use."""
+    global _sharded_collection
+    with _sharded_lock:
+        if _sharded_collection is None:
+            _sharded_collection = ShardedCollection(server_settings.COLLECTION_NAME, server_settings.VECTOR_SHARDS)
+        return _sharded_collection
+
+
+def stop_shards() -> None:
+    global _sharded_collection
+    with _sharded_lock:
+        collection, _sharded_collection = _sharded_collection, None
+    if collection is not None:
+        collection.stop()
+        logger.info("Vector shards stopped")
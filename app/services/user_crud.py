@@ -3,11 +3,13 @@ from typing import Any
 
 from sqlalchemy import delete, func
 from sqlmodel import Session, select, col
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core.security import verify_password, get_password_hash
+from app.core.security import verify_password, averify_password, get_password_hash, invalidate_cached_user
 from app.models.schemas_models import Message
 from app.models.user_models import User, UserRegister, UserUpdate, UsersPublic
 from app.models.conversation_models import Session as Conversation
+from app.services.embedding_service import delete_user_collection
 from pydantic import EmailStr
 
 
@@ -29,6 +31,7 @@ def update_user(*, db: Session, db_user: User, user_in: UserUpdate) -> Any:
     db_user.sqlmodel_update(user_data, update=extra_data)
     db.add(db_user)
     db.commit()
+    invalidate_cached_user(db_user.user_id)
     db.refresh(db_user)
     return db_user
 
@@ -36,6 +39,8 @@ def update_user(*, db: Session, db_user: User, user_in: UserUpdate) -> Any:
 def delete_user(*, db: Session, user: User) -> Message:
     db.delete(user)
     db.commit()
+    invalidate_cached_user(user.user_id)
+    delete_user_collection(user.user_id)
     return Message(message="User deleted successfully")
 
 
@@ -48,6 +53,18 @@ def authenticate_user(db: Session, username: str, password: str):
     return user
 
 
+async def authenticate_user_async(db: AsyncSession, username: str, password: str):
+    user = await get_user_by_username_async(db, username)
+    # end the read transaction: the connection goes back to the pool while the password is checked
+    # (nothing is expired on commit, `user` stays loaded and attached to the caller's session)
+    await db.commit()
+    if not user:
+        return False
+    if not await averify_password(password, user.hashed_password):
+        return False
+    return user
+
+
 # def get_user(db: Session, username: str):
 #     db_user = db.query(User).filter(User.username == username).first()
 #     return db_user
@@ -65,6 +82,12 @@ def get_user_by_username(db: Session, username: str) -> User | None:
     return session_user
 
 
+async def get_user_by_username_async(db: AsyncSession, username: str) -> User | None:
+    statement = select(User).where(User.username == username)
+    session_user = (await db.exec(statement)).first()
+    return session_user
+
+
 def get_user_by_email(db: Session, email: EmailStr) -> User | None:
     statement = select(User).where(User.email == email)
     session_user = db.exec(statement).first()
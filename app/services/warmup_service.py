@@ -0,0 +1,150 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from app.core.config import settings as server_settings
+from app.utils.logger import logger
+
+
+# ========================================
+# SECTION 11: WARMUP
+# ========================================
+
+class WarmupState:
+    """Progress of the warmup phase, reported by /readyz."""
+
+    def __init__(self):
+        self.status = "pending"  # pending -> warming -> ready | retrying (-> warming)
+        self.steps: Dict[str, Dict] = {}
+        self.started_at: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.attempts = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def report(self) -> dict:
+        return {"status": self.status, "duration_s": self.duration, "attempts": self.attempts, "steps": self.steps}
+
+    def done(self, step: str) -> bool:
+        return self.steps.get(step, {}).get("ok", False)
+
+
+warmup_state = WarmupState()
+
+
+async def _step(name: str, run):
+    """Run a warmup step (`run()` returns its coroutine), recording its duration and error; done steps are skipped."""
+    if warmup_state.done(name):
+        return
+    started = time.perf_counter()
+    try:
+        await run()
+        warmup_state.steps[name] = {"ok": True, "seconds": round(time.perf_counter() - started, 3)}
+    except Exception as e:
+        warmup_state.steps[name] = {"ok": False, "seconds": round(time.perf_counter() - started, 3),
+                                    "error": str(e)}
+        logger.exception(f"Warmup step {name} failed: {e}")
+        raise
+
+
+def _load_encoder():
+    from app.services.embedding_service import get_embedding_model
+
+    get_embedding_model().encode(["warmup"])
+
+
+def _open_collection():
+    from app.services.retriever_service import get_collection
+
+    get_collection().count()
+
+
+def _import_generation():
+    # llama_index and the agent services are imported lazily, do it now instead of on the first chat
+    import app.services.generator_service  # noqa: F401
+    import app.services.rag_service  # noqa: F401
+
+
+def _load_tokenizers(models):
+    # the first token count of a model loads its tokenizer (a download on a fresh host)
+    from app.utils.token_utils import get_tokenizer
+
+    for model in models:
+        get_tokenizer(model)
+
+
+async def _preload_llm(model: str):
+    # a generate request without prompt loads the model into memory and returns
+    async with httpx.AsyncClient(base_url=server_settings.OLLAMA_BASE_URL,
+                                 timeout=server_settings.WARMUP_TIMEOUT_SECONDS) as client:
+        response = await client.post("/api/generate", json={"model": model,
+                                                            "keep_alive": server_settings.OLLAMA_KEEP_ALIVE})
+        response.raise_for_status()
+
+
+def _dummy_query():
+    from app.services.retriever_service import search_query_pipline
+
+    # also indexes the documents if the collection is empty and loads the HNSW index
+    search_query_pipline("warmup")
+
+
+async def warm_up():
+    """
+    Preload everything the first RAG / chat request would otherwise wait for.
+
+    This section demonstrates:
+    - Loading the query encoder and the tokenizers, opening the vector collection and
+      preloading the Ollama models concurrently
+    - A dummy vector query once the encoder and the collection are loaded
+    - Reporting readiness only once every step succeeded, retrying the failed ones with backoff
+    """
+    warmup_state.started_at = time.perf_counter()
+    models = list(dict.fromkeys([server_settings.LLM_MODEL, server_settings.AGENT_MODEL]))
+
+    async def retrieval():
+        await asyncio.gather(
+            _step("encoder", lambda: asyncio.to_thread(_load_encoder)),
+            _step("collection", lambda: asyncio.to_thread(_open_collection)),
+        )
+        await _step("dummy_query", lambda: asyncio.to_thread(_dummy_query))
+
+    while True:
+        warmup_state.status = "warming"
+        warmup_state.attempts += 1
+        try:
+            # every step runs to completion (and is reported) even if another one failed,
+            # the ones that succeeded are not run again on retry
+            steps = asyncio.gather(
+                retrieval(),
+                _step("imports", lambda: asyncio.to_thread(_import_generation)),
+                _step("tokenizers", lambda: asyncio.to_thread(_load_tokenizers, models)),
+                *(_step(f"llm:{model}", lambda model=model: _preload_llm(model)) for model in models),
+                return_exceptions=True,
+            )
+            try:
+                results = await asyncio.wait_for(steps, server_settings.WARMUP_TIMEOUT_SECONDS)
+            except asyncio.CancelledError:
+                # cancelled at shutdown: the outcome of the cancelled steps is not needed
+                steps.add_done_callback(lambda future: future.cancelled() or future.exception())
+                raise
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if errors:
+                raise errors[0]
+            warmup_state.status = "ready"
+            break
+        except Exception as e:
+            # a dependency not up yet at boot must not keep the worker out of rotation for good
+            delay = min(server_settings.WARMUP_RETRY_BACKOFF_SECONDS * 2 ** (warmup_state.attempts - 1),
+                        server_settings.WARMUP_RETRY_MAX_DELAY_SECONDS)
+            warmup_state.status = "retrying"
+            logger.error(f"Warmup attempt {warmup_state.attempts} failed: {e!r}, retrying in {delay:g}s")
+            await asyncio.sleep(delay)
+        finally:
+            warmup_state.duration = round(time.perf_counter() - warmup_state.started_at, 3)
+    logger.info(f"Warmup {warmup_state.status} in {warmup_state.duration}s "
+                f"({warmup_state.attempts} attempts): {warmup_state.steps}")
@@ -0,0 +1,112 @@
+"""
+Local SMTP stand-in for development and tests: accepts every email and keeps it in memory.
+
+Point the app at it with SMTP_HOST=127.0.0.1 SMTP_PORT=1025 SMTP_TLS=False SMTP_SSL=False,
+optionally slow or flaky to exercise the email queue:
+
+    python -m app.utils.local_smtp --port 1025 --delay 2 --fail-rate 0.3
+"""
+
+import argparse
+import asyncio
+import random
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from app.utils.logger import logger
+
+
+@dataclass
+class ReceivedEmail:
+    mail_from: str
+    rcpt_to: List[str]
+    data: bytes
+
+
+@dataclass
+class LocalSMTPServer:
+    host: str = "127.0.0.1"
+    port: int = 1025
+    # seconds each DATA command takes, and share of emails answered with a temporary failure
+    delay: float = 0.0
+    fail_rate: float = 0.0
+    received: List[ReceivedEmail] = field(default_factory=list)
+    connections: int = 0
+    _server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Local SMTP server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+
+        async def reply(line: str):
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        mail_from, rcpt_to = "", []
+        await reply("220 localhost local SMTP stand-in")
+        try:
+            while line := await reader.readline():
+                command = line.decode(errors="replace").strip()
+                verb = command[:4].upper()
+                if verb == "EHLO":
+                    await reply("250-localhost")
+                    await reply("250 AUTH PLAIN")
+                elif verb == "HELO":
+                    await reply("250 localhost")
+                elif verb == "AUTH":
+                    # any credentials are accepted
+                    await reply("235 Authentication successful")
+                elif verb == "MAIL":
+                    mail_from, rcpt_to = command.split(":", 1)[1].strip(), []
+                    await reply("250 OK")
+                elif verb == "RCPT":
+                    rcpt_to.append(command.split(":", 1)[1].strip())
+                    await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = b""
+                    while (chunk := await reader.readline()) not in (b".\r\n", b".\n", b""):
+                        data += chunk
+                    await asyncio.sleep(self.delay)
+                    if random.random() < self.fail_rate:
+                        await reply("451 Temporary local failure")
+                    else:
+                        self.received.append(ReceivedEmail(mail_from, rcpt_to, data))
+                        await reply("250 OK queued")
+                elif verb in ("RSET", "NOOP"):
+                    await reply("250 OK")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
+
+
+async def main(args):
+    server = LocalSMTPServer(host=args.host, port=args.port, delay=args.delay, fail_rate=args.fail_rate)
+    await server.start()
+    try:
+        while True:
+            await asyncio.sleep(10)
+            logger.info(f"Local SMTP server: {len(server.received)} emails over {server.connections} connections")
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
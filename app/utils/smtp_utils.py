@@ -3,7 +3,8 @@ from pathlib import Path
 from typing import Any
 
 import emails  # type: ignore
-from jinja2 import Template
+from emails.backend import SMTPBackend  # type: ignore
+from jinja2 import Environment, FileSystemLoader
 from pydantic import EmailStr
 
 from app.core.config import settings
@@ -13,36 +14,51 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Templates are compiled once on first use and kept by the environment (the built files don't change at runtime)
+template_env = Environment(
+    loader=FileSystemLoader(Path(__file__).parent / "email-templates" / "build"),
+    auto_reload=False,
+)
+
+
 def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
-    template_str = (
-            Path(__file__).parent / "email-templates" / "build" / template_name
-    ).read_text()
-    html_content = Template(template_str).render(context)
+    html_content = template_env.get_template(template_name).render(context)
     return html_content
 
 
+def smtp_options() -> dict[str, Any]:
+    smtp_options = {"host": settings.SMTP_HOST, "port": settings.SMTP_PORT}
+    if settings.SMTP_TLS:
+        smtp_options["tls"] = True
+    elif settings.SMTP_SSL:
+        smtp_options["ssl"] = True
+    if settings.SMTP_USER:
+        smtp_options["user"] = settings.SMTP_USER
+    if settings.SMTP_PASSWORD:
+        smtp_options["password"] = settings.SMTP_PASSWORD
+    return smtp_options
+
+
+def smtp_connection() -> SMTPBackend:
+    """SMTP connection to send several emails with, raising on errors; close it when done."""
+    return SMTPBackend(fail_silently=False, **smtp_options())
+
+
 def send_email(
         *,
         email_to: EmailStr,
         subject: str = "",
         html_content: str = "",
+        smtp: SMTPBackend | None = None,
 ) -> None:
+    """Send an email, over the given SMTP connection or a new one."""
     assert settings.emails_enabled, "no provided configuration for email variables"
     message = emails.Message(
         subject=subject,
         html=html_content,
         mail_from=(settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL),
     )
-    smtp_options = {"host": settings.SMTP_HOST, "port": settings.SMTP_PORT}
-    if settings.SMTP_TLS:
-        smtp_options["tls"] = True
-    elif settings.SMTP_SSL:
-        smtp_options["ssl"] = True
-    if settings.SMTP_USER:
-        smtp_options["user"] = settings.SMTP_USER
-    if settings.SMTP_PASSWORD:
-        smtp_options["password"] = settings.SMTP_PASSWORD
-    response = message.send(to=email_to, smtp=smtp_options)
+    response = message.send(to=email_to, smtp=smtp if smtp is not None else smtp_options())
     logger.info(f"send email result: {response}")
 
 
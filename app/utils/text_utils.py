@@ -6,4 +6,9 @@ def compute_file_hash(file_path: str) -> str:
     with open(file_path, "rb") as f:
         for chunk in iter(lambda: f.read(8192), b""): # avoids reading the whole file into memory.
             h.update(chunk)
-    return h.hexdigest()
\ No newline at end of file
+    return h.hexdigest()
+
+
+def compute_bytes_hash(data: bytes) -> str:
+    """SHA256 hash of in-memory content (e.g. an upload), same digest as `compute_file_hash`."""
+    return hashlib.sha256(data).hexdigest()
@@ -0,0 +1,66 @@
+"""
+Token counting helpers used to budget prompts against the LLM context window
+"""
+
+from functools import lru_cache
+from typing import Callable
+
+from app.core.config import settings as server_settings
+from app.utils.logger import logger
+
+
+@lru_cache(maxsize=8)
+def get_tokenizer(model: str) -> Callable[[str], list]:
+    """
+    Return an `encode(text) -> token ids` function for the given Ollama model.
+
+    The Hugging Face tokenizer of the model is preferred; if it can't be loaded
+    (offline worker, unknown model) fall back to tiktoken's cl100k_base, and as a
+    last resort to a ~4 characters per token estimate.
+    """
+    tokenizer_name = server_settings.LLM_TOKENIZERS.get(model)
+    if tokenizer_name:
+        try:
+            from transformers import AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+            return lambda text: tokenizer.encode(text, add_special_tokens=False)
+        except Exception as e:
+            logger.warning(f"Could not load tokenizer {tokenizer_name} for {model}: {e}")
+
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return encoding.encode
+    except Exception as e:
+        logger.warning(f"Could not load tiktoken encoding, estimating token counts: {e}")
+        return lambda text: [0] * ((len(text) + 3) // 4)
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """Count the tokens of `text` with the tokenizer of `model` (defaults to the RAG LLM)."""
+    if not text:
+        return 0
+    return len(get_tokenizer(model or server_settings.LLM_MODEL)(text))
+
+
+def message_text(data: dict) -> str:
+    """Concatenate the text a stored chat message (`MessageData` dump) sends to the LLM."""
+    parts = [block.get("text") or "" for block in data.get("blocks", []) if block.get("block_type") == "text"]
+    tool_calls = data.get("additional_kwargs", {}).get("tool_calls")
+    if tool_calls:
+        parts.append(str(tool_calls))
+    return "\n".join(parts)
+
+
+def count_message_tokens(data: dict, model: str | None = None) -> int:
+    """Count the tokens of a stored chat message, including the chat template overhead."""
+    # role markers / separators added by the chat template
+    message_overhead = 4
+    return count_tokens(message_text(data), model or server_settings.AGENT_MODEL) + message_overhead
+
+
+def estimate_message_tokens(data: dict) -> int:
+    """Cheap token estimate for messages stored before token counts were recorded."""
+    return (len(message_text(data)) + 3) // 4 + 4
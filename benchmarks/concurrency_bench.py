@@ -0,0 +1,114 @@
+"""
+Concurrency benchmark of the session and chat endpoints.
+
+Fires concurrent requests at a running server and reports throughput and latency
+percentiles as JSON. Run it against two checkouts (e.g. before and after a change)
+with the same arguments and compare the reports.
+
+    uvicorn app.main:app --host 127.0.0.1 --port 8000
+    python benchmarks/concurrency_bench.py --username brain --password ... --concurrency 32 --requests 500
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> dict:
+    response = await client.post("/auth/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run_scenario(name: str, send, total: int, concurrency: int) -> dict:
+    """Send `total` requests with at most `concurrency` in flight, `send(i)` returns the response."""
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await send(i)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+        },
+    }
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        headers = await login(client, args.username, args.password)
+        response = await client.post("/sessions", json={"title": "benchmark"}, headers=headers)
+        response.raise_for_status()
+        session_id = response.json()["session_id"]
+
+        reports = [await run_scenario(
+            "GET /sessions",
+            lambda i: client.get("/sessions", headers=headers),
+            args.requests, args.concurrency,
+        )]
+        if not args.skip_chat:
+            # one session per in-flight request so the turns of a session stay sequential
+            sessions = []
+            for _ in range(args.concurrency):
+                response = await client.post("/sessions", json={"title": "benchmark"}, headers=headers)
+                sessions.append(response.json()["session_id"])
+            reports.append(await run_scenario(
+                "POST /v1/chat/{session_id}",
+                lambda i: client.post(f"/v1/chat/{sessions[i % len(sessions)]}",
+                                      params={"query": args.query}, headers=headers),
+                args.chat_requests, args.concurrency,
+            ))
+            for sid in sessions:
+                await client.delete(f"/sessions/{sid}", headers=headers)
+        await client.delete(f"/sessions/{session_id}", headers=headers)
+
+    print(json.dumps({"base_url": args.base_url, "results": reports}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=500, help="GET /sessions requests")
+    parser.add_argument("--chat-requests", type=int, default=64, help="POST /v1/chat requests")
+    parser.add_argument("--query", default="Who was the second president of the United States?")
+    parser.add_argument("--skip-chat", action="store_true", help="don't benchmark the chat endpoint (no Ollama)")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    asyncio.run(main(parser.parse_args()))
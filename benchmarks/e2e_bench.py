@@ -0,0 +1,191 @@
+"""
+End-to-end offline benchmark: synthetic corpus, fake LLM, real app.
+
+Generates a synthetic corpus in the `*.txt.clean` layout, starts the fake Ollama server
+(benchmarks/fake_ollama.py) and the app in a subprocess pointed at both (its own corpus
+directory, vector store and collection), then:
+
+- indexes the corpus through POST /v1/index (ingestion throughput)
+- drives /v1/search, /v1/ask and /v1/chat at the given concurrency (QPS, p50/p95/p99)
+- reads the peak RSS of the server process
+
+and prints one JSON report. Database and SMTP settings come from the environment /
+.env as for the app itself. Run it on two commits with the same arguments to compare.
+
+    python benchmarks/e2e_bench.py --username brain --password ... --docs 200 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from concurrency_bench import login, run_scenario
+from fake_ollama import start_in_thread
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VOCABULARY = ("president congress election treaty army navy governor senate court law tax trade war peace "
+              "colony independence constitution republic federal state union party vote policy minister "
+              "revolution declaration frontier railroad industry bank currency tariff slavery reform").split()
+
+
+def generate_corpus(path: str, docs: int, words: int, seed: int = 0) -> dict:
+    """Write `docs` synthetic articles, each about one entity named in its title and text."""
+    rng = random.Random(seed)
+    total_bytes = 0
+    for i in range(docs):
+        entity = f"Entity{i:05d}"
+        sentences = []
+        for _ in range(max(1, words // 12)):
+            sentence = rng.choices(VOCABULARY, k=11)
+            sentence[0] = sentence[0].capitalize()
+            sentence.insert(rng.randrange(len(sentence)), entity)
+            sentences.append(" ".join(sentence) + ".")
+        paragraphs = [" ".join(sentences[j:j + 6]) for j in range(0, len(sentences), 6)]
+        content = f"{entity}\n\n\n\n" + "\n\n".join(paragraphs) + "\n"
+        # a few sub-directories, like a real data dir (read recursively)
+        directory = os.path.join(path, f"set{i // 100:03d}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{entity}.txt.clean"), "w", encoding="utf-8") as f:
+            f.write(content)
+        total_bytes += len(content.encode())
+    return {"documents": docs, "bytes": total_bytes}
+
+
+def peak_rss_mb(pid: int) -> float | None:
+    """High-water mark of the resident memory of a process (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+async def wait_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if (await client.get("/readyz")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError("Server not ready in time")
+
+
+async def run(args, base_url: str, server: subprocess.Popen, corpus: dict) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        started = time.perf_counter()
+        await wait_ready(client, server, args.ready_timeout)
+        ready_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        response = await client.post("/v1/index")
+        response.raise_for_status()
+        index_s = time.perf_counter() - started
+
+        rng = random.Random(args.seed)
+        queries = [f"What did Entity{rng.randrange(args.docs):05d} do about the {rng.choice(VOCABULARY)}?"
+                   for _ in range(max(args.requests, args.chat_requests))]
+        headers = await login(client, args.username, args.password)
+        # one session per in-flight request so the turns of a session stay sequential
+        sessions = []
+        for _ in range(args.concurrency):
+            response = await client.post("/sessions", json={"title": "e2e benchmark"}, headers=headers)
+            response.raise_for_status()
+            sessions.append(response.json()["session_id"])
+
+        scenarios = [
+            await run_scenario("POST /v1/search", lambda i: client.post("/v1/search", params={"query": queries[i]}),
+                               args.requests, args.concurrency),
+            await run_scenario("POST /v1/ask", lambda i: client.post("/v1/ask", params={"query": queries[i]}),
+                               args.requests, args.concurrency),
+            await run_scenario("POST /v1/chat/{session_id}",
+                               lambda i: client.post(f"/v1/chat/{sessions[i % len(sessions)]}",
+                                                     params={"query": queries[i]}, headers=headers),
+                               args.chat_requests, args.concurrency),
+        ]
+        for session_id in sessions:
+            await client.delete(f"/sessions/{session_id}", headers=headers)
+
+    return {
+        "startup_to_ready_s": round(ready_s, 3),
+        "ingestion": {
+            **corpus,
+            "elapsed_s": round(index_s, 3),
+            "docs_per_s": round(corpus["documents"] / index_s, 2),
+            "mb_per_s": round(corpus["bytes"] / 1e6 / index_s, 3),
+        },
+        "endpoints": scenarios,
+    }
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="e2e_bench_")
+    corpus_dir = os.path.join(workdir, "articles")
+    corpus = generate_corpus(corpus_dir, args.docs, args.doc_words, args.seed)
+    llm = start_in_thread(port=args.llm_port, token_latency=args.token_latency_ms / 1000,
+                          answer_tokens=args.answer_tokens)
+
+    env = dict(
+        os.environ,
+        DATA_DIR=corpus_dir,
+        VECTOR_DB_PATH=os.path.join(workdir, "chroma"),
+        COLLECTION_NAME=f"e2e_bench_{args.docs}",
+        OLLAMA_BASE_URL=f"http://127.0.0.1:{args.llm_port}",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    try:
+        report = asyncio.run(run(args, f"http://127.0.0.1:{args.port}", server, corpus))
+    finally:
+        # read before terminating, the process status is gone afterwards
+        peak = peak_rss_mb(server.pid)
+        server.terminate()
+        server.wait(timeout=30)
+        llm.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report["server_peak_rss_mb"] = peak
+    report["config"] = {key: value for key, value in vars(args).items() if key not in ("password",)}
+    report["fake_llm"] = {"requests": llm.stats["requests"], "tokens": llm.stats["tokens"]}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--docs", type=int, default=200, help="documents in the synthetic corpus")
+    parser.add_argument("--doc-words", type=int, default=800, help="words per document")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per search / ask scenario")
+    parser.add_argument("--chat-requests", type=int, default=64)
+    parser.add_argument("--token-latency-ms", type=float, default=10.0, help="fake LLM time per generated token")
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8765, help="port of the app under test")
+    parser.add_argument("--llm-port", type=int, default=11435, help="port of the fake Ollama server")
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the corpus and vector store")
+    main(parser.parse_args())
@@ -0,0 +1,131 @@
+"""
+Deterministic stand-in for the Ollama HTTP API, for benchmarks without a GPU or models.
+
+Answers /api/chat (with tool calls) and /api/generate like Ollama does, after sleeping
+`token_latency` seconds per generated token, so the latency of generation is controlled
+and reproducible. With tools offered and a user message last, the first tool is called
+with the user message as `query`; otherwise a fixed answer of `answer_tokens` words.
+
+    python benchmarks/fake_ollama.py --port 11435 --token-latency-ms 20
+    OLLAMA_BASE_URL=http://127.0.0.1:11435 uvicorn app.main:app
+"""
+
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # set on the subclass built by `make_server`
+    token_latency = 0.0
+    answer_tokens = 64
+    stats = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path in ("/", "/api/version"):
+            self._send(200, {"version": "0.0.0-fake"})
+        elif self.path == "/api/tags":
+            self._send(200, {"models": []})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/api/chat":
+            self._send(200, self._chat(request))
+        elif self.path == "/api/generate":
+            self._send(200, self._generate(request))
+        elif self.path == "/api/show":
+            self._send(200, {"model_info": {}, "capabilities": ["completion", "tools"]})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _timed(self, request: dict, prompt_chars: int, tokens: int, body: dict) -> dict:
+        started = time.perf_counter_ns()
+        time.sleep(self.token_latency * tokens)
+        elapsed = time.perf_counter_ns() - started
+        with self.stats["lock"]:
+            self.stats["requests"] += 1
+            self.stats["tokens"] += tokens
+        return {
+            "model": request.get("model", "fake"),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": elapsed,
+            "load_duration": 0,
+            "prompt_eval_count": prompt_chars // 4,
+            "prompt_eval_duration": 0,
+            "eval_count": tokens,
+            "eval_duration": elapsed,
+            **body,
+        }
+
+    def _chat(self, request: dict) -> dict:
+        messages = request.get("messages") or []
+        prompt_chars = sum(len(message.get("content") or "") for message in messages)
+        last = messages[-1] if messages else {}
+        tools = request.get("tools") or []
+        if tools and last.get("role") == "user":
+            tool_call = {"function": {"name": tools[0]["function"]["name"],
+                                      "arguments": {"query": last.get("content") or ""}}}
+            return self._timed(request, prompt_chars, 8, {
+                "message": {"role": "assistant", "content": "", "tool_calls": [tool_call]}})
+        return self._timed(request, prompt_chars, self.answer_tokens, {
+            "message": {"role": "assistant", "content": self._answer(last.get("content") or "")}})
+
+    def _generate(self, request: dict) -> dict:
+        prompt = request.get("prompt") or ""
+        # empty prompt: a model preload (see warmup_service), nothing is generated
+        tokens = self.answer_tokens if prompt else 0
+        return self._timed(request, len(prompt), tokens, {"response": self._answer(prompt) if prompt else ""})
+
+    def _answer(self, prompt: str) -> str:
+        words = (prompt.split() or ["answer"])[:8]
+        return " ".join(words[i % len(words)] for i in range(self.answer_tokens))
+
+
+def make_server(host: str = "127.0.0.1", port: int = 11435, token_latency: float = 0.0,
+                answer_tokens: int = 64) -> ThreadingHTTPServer:
+    handler = type("Handler", (FakeOllamaHandler,), {
+        "token_latency": token_latency,
+        "answer_tokens": answer_tokens,
+        "stats": {"lock": threading.Lock(), "requests": 0, "tokens": 0},
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.stats = handler.stats
+    return server
+
+
+def start_in_thread(**kwargs) -> ThreadingHTTPServer:
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-latency-ms", type=float, default=20.0, help="generation time per token")
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    args = parser.parse_args()
+    print(f"Fake Ollama listening on http://{args.host}:{args.port}")
+    make_server(args.host, args.port, args.token_latency_ms / 1000, args.answer_tokens).serve_forever()
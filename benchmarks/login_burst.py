@@ -0,0 +1,106 @@
+"""
+Login burst load test: latency of authenticated requests while many users log in.
+
+Measures the latency of a probe endpoint (GET /sessions by default, or the chat endpoint
+with --probe chat) sent at a steady rate, first alone and then during a burst of
+concurrent logins, and prints both latency distributions as JSON. With password hashing
+on the event loop the probe latency grows with the burst; off the loop it should not.
+
+    python benchmarks/login_burst.py --username brain --password ... --logins 200 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from concurrency_bench import login, percentile
+
+
+def summary(latencies: list[float]) -> dict:
+    return {
+        "samples": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 2),
+    }
+
+
+async def probe(client: httpx.AsyncClient, send, stop: asyncio.Event, interval: float) -> list[float]:
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await send(client)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def burst(client: httpx.AsyncClient, args) -> dict:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    statuses = {}
+
+    async def one():
+        async with semaphore:
+            response = await client.post("/auth/token", data={"username": args.username, "password": args.password})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.logins)))
+    elapsed = time.perf_counter() - start
+    return {"logins": args.logins, "elapsed_s": round(elapsed, 3),
+            "logins_per_s": round(args.logins / elapsed, 2), "statuses": statuses}
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        headers = await login(client, args.username, args.password)
+        session_id = (await client.post("/sessions", json={"title": "login burst"}, headers=headers)).json()["session_id"]
+        if args.probe == "chat":
+            async def send(c):
+                return await c.post(f"/v1/chat/{session_id}", params={"query": args.query}, headers=headers)
+        else:
+            async def send(c):
+                return await c.get("/sessions", headers=headers)
+
+        # baseline: probe alone
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, send, stop, args.interval))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        baseline = await task
+
+        # probe during the login burst
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, send, stop, args.interval))
+        burst_report = await burst(client, args)
+        stop.set()
+        during = await task
+
+        await client.delete(f"/sessions/{session_id}", headers=headers)
+
+    print(json.dumps({
+        "probe": args.probe,
+        "baseline": summary(baseline),
+        "during_burst": summary(during),
+        "burst": burst_report,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent logins")
+    parser.add_argument("--probe", choices=["sessions", "chat"], default="sessions")
+    parser.add_argument("--query", default="Who was the second president of the United States?")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between probe requests")
+    parser.add_argument("--baseline-seconds", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,159 @@
+"""
+Query-plan benchmark of the session listing and history loads on a synthetic table.
+
+Creates the app tables in a scratch Postgres schema, fills it with synthetic users,
+sessions and messages (10M messages by default) using generate_series, then runs
+EXPLAIN (ANALYZE, BUFFERS) on the queries issued by `conversation_crud` and checks
+that each of them is served by an index (no sequential scan of the big tables).
+
+    python benchmarks/query_plans.py --messages 10000000
+    python benchmarks/query_plans.py --messages 200000 --keep   # keep the schema to re-run
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from uuid import UUID
+
+from sqlalchemy import text, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlmodel import SQLModel, select
+
+from app.core.db import engine
+from app.models.conversation_models import Message, Session as ChatSession, SUMMARY_KEY
+
+SCHEMA = "query_plan_bench"
+# tables whose sequential scan means a missing index
+BIG_TABLES = {"message", "session"}
+
+
+def fill(connection, users: int, sessions: int, messages: int):
+    per_session = max(1, messages // sessions)
+    statements = [
+        f"""
+        INSERT INTO "user" (user_id, username, email, first_name, last_name, is_active, is_superuser,
+                            hashed_password, created_at)
+        SELECT md5('user' || u)::uuid, 'user' || u, 'user' || u || '@bench.local', 'first', 'last',
+               true, false, 'x', now()
+        FROM generate_series(1, {users}) AS u
+        """,
+        f"""
+        INSERT INTO session (session_id, user_id, title, created_at, last_active_at)
+        SELECT md5('session' || s)::uuid, md5('user' || (s % {users} + 1))::uuid, 'session ' || s,
+               now() - (s || ' seconds')::interval, now()
+        FROM generate_series(1, {sessions}) AS s
+        """,
+        # every message of a session 1s apart, a summary every 40 messages
+        f"""
+        INSERT INTO message (message_id, session_id, created_at, tokens, data)
+        SELECT md5('message' || m)::uuid,
+               md5('session' || (m % {sessions} + 1))::uuid,
+               timestamptz '2025-01-01' + ((m / {sessions}) || ' seconds')::interval,
+               32,
+               jsonb_build_object(
+                   'role', CASE WHEN m / {sessions} % 40 = 39 THEN 'system'
+                                WHEN m / {sessions} % 2 = 0 THEN 'user' ELSE 'assistant' END,
+                   'blocks', jsonb_build_array(jsonb_build_object('block_type', 'text',
+                                                                  'text', 'synthetic message ' || m)),
+                   'additional_kwargs', CASE WHEN m / {sessions} % 40 = 39
+                       THEN jsonb_build_object('{SUMMARY_KEY}', jsonb_build_object('until_id', md5('message' || (m - {sessions}))::uuid,
+                                                                         'until_created_at', '2025-01-01T00:00:00+00:00'))
+                       ELSE '{{}}'::jsonb END)
+        FROM generate_series(0, {per_session * sessions - 1}) AS m
+        """,
+    ]
+    for statement in statements:
+        started = time.perf_counter()
+        connection.execute(text(statement))
+        print(f"  {statement.split()[2]:<8} {time.perf_counter() - started:7.1f}s", file=sys.stderr)
+    connection.execute(text("ANALYZE"))
+
+
+def queries(connection, limit: int) -> dict:
+    """The queries of `conversation_crud`, on a session / user of the synthetic data."""
+    session_id, user_id = connection.execute(text(
+        "SELECT session_id, user_id FROM session ORDER BY session_id LIMIT 1"
+    )).one()
+    middle = connection.execute(text(
+        "SELECT created_at, message_id FROM message WHERE session_id = :s ORDER BY created_at, message_id "
+        "OFFSET (SELECT count(*) / 2 FROM message WHERE session_id = :s) LIMIT 1"
+    ), {"s": session_id}).one()
+    key = tuple_(Message.created_at, Message.message_id)
+    return {
+        "get_all_sessions": select(ChatSession).where(ChatSession.user_id == user_id)
+        .order_by(ChatSession.created_at.desc()).limit(10),
+        "get_messages_page (first page)": select(Message).where(Message.session_id == session_id)
+        .order_by(Message.created_at.desc(), Message.message_id.desc()).limit(limit + 1),
+        "get_messages_page (cursor)": select(Message).where(Message.session_id == session_id)
+        .where(key < tuple_(*middle))
+        .order_by(Message.created_at.desc(), Message.message_id.desc()).limit(limit + 1),
+        "get_chat_window (summary)": select(Message).where(Message.session_id == session_id)
+        .where(Message.data["additional_kwargs"][SUMMARY_KEY].isnot(None))
+        .order_by(Message.created_at.desc(), Message.message_id.desc()).limit(1),
+        "get_chat_window (window)": select(Message).where(Message.session_id == session_id)
+        .where(key > tuple_(datetime(2025, 1, 1, tzinfo=timezone.utc), UUID(int=0)))
+        .order_by(Message.created_at.desc(), Message.message_id.desc()).limit(200),
+    }
+
+
+def scans(plan: dict):
+    """(node type, relation, index) of every scan node of a JSON plan."""
+    if "Relation Name" in plan or "Index Name" in plan:
+        yield plan["Node Type"], plan.get("Relation Name"), plan.get("Index Name")
+    for child in plan.get("Plans", []):
+        yield from scans(child)
+
+
+def explain(connection, name: str, query) -> dict:
+    sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    plan = connection.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")).scalar()[0]
+    nodes = list(scans(plan["Plan"]))
+    return {
+        "query": name,
+        "execution_ms": plan["Execution Time"],
+        "planning_ms": plan["Planning Time"],
+        "scans": [{"node": node, "relation": relation, "index": index} for node, relation, index in nodes],
+        "indexed": all(node != "Seq Scan" for node, relation, _ in nodes if relation in BIG_TABLES),
+    }
+
+
+def main(args):
+    bench_engine = engine.execution_options(schema_translate_map={None: SCHEMA})
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}"))
+    try:
+        with bench_engine.begin() as connection:
+            connection.execute(text(f"SET LOCAL search_path TO {SCHEMA}"))
+            empty = not connection.execute(text(
+                "SELECT EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = :s AND tablename = 'message')"
+            ), {"s": SCHEMA}).scalar()
+            if empty:
+                SQLModel.metadata.create_all(connection)
+                print(f"Generating {args.messages} messages in {args.sessions} sessions...", file=sys.stderr)
+                fill(connection, args.users, args.sessions, args.messages)
+
+        with bench_engine.connect() as connection:
+            connection.execute(text(f"SET search_path TO {SCHEMA}"))
+            count = connection.execute(text("SELECT reltuples::bigint FROM pg_class WHERE relname = 'message' "
+                                            "AND relnamespace = CAST(:s AS regnamespace)"), {"s": SCHEMA}).scalar()
+            results = [explain(connection, name, query) for name, query in queries(connection, args.limit).items()]
+    finally:
+        if not args.keep:
+            with engine.begin() as connection:
+                connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+    print(json.dumps({"messages": count, "results": results}, indent=2))
+    if not all(result["indexed"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--limit", type=int, default=50, help="page size of get_messages_page")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic schema for later runs")
+    main(parser.parse_args())
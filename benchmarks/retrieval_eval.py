@@ -0,0 +1,186 @@
+"""
+Retrieval quality vs latency of the chunking and HNSW index parameters.
+
+Sweeps chunk size, chunk overlap, HNSW M / construction ef / search ef and top_k over a
+labelled question set (benchmarks/retrieval_labels.json, questions on the bundled
+S08_set3 articles with the passage answering each one) and reports, per combination:
+
+- recall@k: share of the questions with a relevant chunk in the top k
+- MRR: mean reciprocal rank of the first relevant chunk (0 when none in the top k)
+- index build time and size on disk, query latency (p50 / p95)
+
+A chunk is relevant when it comes from the labelled article and covers at least
+`--min-coverage` of the labelled passage. Chunks are embedded once per chunking with the
+app's embedding model, each index is then built from these embeddings. The report ends
+with the fastest combination meeting `--recall-target`.
+
+    PYTHONPATH=. python benchmarks/retrieval_eval.py --chunk-sizes 200,400,800 --overlaps 0,50 \\
+        --top-k 1,3,5 --m 8,16,32 --ef-search 10,50,100 --recall-target 0.8
+"""
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from concurrency_bench import percentile
+
+from app.core.config import settings as server_settings
+from app.services.embedding_service import get_embedding_model, load_and_chunk_documents
+
+LABELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_labels.json")
+
+
+def int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def relevant_chunks(chunks: list[dict], labels: list[dict], min_coverage: float) -> list[set]:
+    """Ids of the chunks covering the passage of each label."""
+    # the splitter keeps the text of each chunk verbatim, in order: locate them in their document
+    spans = {}
+    texts = {}
+    for chunk in chunks:
+        path = chunk["source_path"]
+        if path not in texts:
+            with open(path, encoding="utf-8") as f:
+                texts[path] = f.read().strip()
+            spans[path] = (0, [])
+        cursor, located = spans[path]
+        start = texts[path].find(chunk["content"], cursor)
+        if start < 0:
+            start = texts[path].find(chunk["content"])
+        located.append((chunk["id"], start, start + len(chunk["content"])))
+        spans[path] = (max(cursor, start + 1), located)
+
+    relevant = []
+    for label in labels:
+        ids = set()
+        for path, (_, located) in spans.items():
+            if os.path.basename(path) != label["source"]:
+                continue
+            passage_start = texts[path].find(label["passage"])
+            passage_end = passage_start + len(label["passage"])
+            for chunk_id, start, end in located:
+                covered = min(end, passage_end) - max(start, passage_start)
+                if passage_start >= 0 and covered >= min_coverage * len(label["passage"]):
+                    ids.add(chunk_id)
+        relevant.append(ids)
+    return relevant
+
+
+def build_index(path: str, chunks: list[dict], embeddings, m: int, ef_construction: int, ef_search: int):
+    import chromadb
+    from chromadb.config import Settings
+
+    client = chromadb.PersistentClient(path, settings=Settings(anonymized_telemetry=False))
+    collection = client.create_collection(
+        name="retrieval_eval",
+        configuration={"hnsw": {"space": "cosine", "max_neighbors": m, "ef_construction": ef_construction,
+                                "ef_search": ef_search}},
+        embedding_function=None,
+    )
+    batch = client.get_max_batch_size()
+    started = time.perf_counter()
+    for i in range(0, len(chunks), batch):
+        collection.add(
+            ids=[chunk["id"] for chunk in chunks[i:i + batch]],
+            embeddings=embeddings[i:i + batch],
+            documents=[chunk["content"] for chunk in chunks[i:i + batch]],
+        )
+    return collection, time.perf_counter() - started
+
+
+def evaluate(collection, query_embeddings, relevant: list[set], top_k: int, ef_search: int) -> dict:
+    hits, reciprocal_ranks, latencies = 0, [], []
+    for embedding, relevant_ids in zip(query_embeddings, relevant):
+        started = time.perf_counter()
+        # same as `search_vector_database`: HNSW explores max(ef_search, n_results) candidates
+        result = collection.query(query_embeddings=[embedding], n_results=max(top_k, ef_search), include=[])
+        latencies.append(time.perf_counter() - started)
+        rank = next((position for position, chunk_id in enumerate(result["ids"][0][:top_k], 1)
+                     if chunk_id in relevant_ids), None)
+        hits += rank is not None
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+    return {
+        "recall_at_k": round(hits / len(relevant), 4),
+        "mrr": round(sum(reciprocal_ranks) / len(relevant), 4),
+        "query_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "query_p95_ms": round(percentile(latencies, 95) * 1000, 3),
+    }
+
+
+def main(args):
+    with open(args.labels, encoding="utf-8") as f:
+        labels = json.load(f)["labels"]
+    model = get_embedding_model()
+
+    started = time.perf_counter()
+    # same preprocessing as `process_user_query`
+    query_embeddings = model.encode([label["question"].lower().strip() for label in labels]).tolist()
+    query_embed_ms = (time.perf_counter() - started) / len(labels) * 1000
+
+    workdir = tempfile.mkdtemp(prefix="retrieval_eval_")
+    results = []
+    try:
+        for chunk_size, overlap in itertools.product(args.chunk_sizes, args.overlaps):
+            if overlap >= chunk_size:
+                continue
+            chunks = load_and_chunk_documents(args.data_dir, chunk_size, overlap)
+            relevant = relevant_chunks(chunks, labels, args.min_coverage)
+            started = time.perf_counter()
+            embeddings = model.encode([chunk["content"] for chunk in chunks], batch_size=64).tolist()
+            embed_s = time.perf_counter() - started
+            unanswerable = sum(1 for ids in relevant if not ids)
+
+            for m, ef_construction in itertools.product(args.m, args.ef_construction):
+                path = os.path.join(workdir, f"{chunk_size}_{overlap}_{m}_{ef_construction}")
+                # the index's own ef_search is the smallest one, larger ones are applied per query
+                collection, build_s = build_index(path, chunks, embeddings, m, ef_construction, min(args.ef_search))
+                index_bytes = dir_size(path)
+                for ef_search in args.ef_search:
+                    for top_k in args.top_k:
+                        results.append({
+                            "chunk_size": chunk_size, "chunk_overlap": overlap, "hnsw_m": m,
+                            "hnsw_ef_construction": ef_construction, "hnsw_ef_search": ef_search, "top_k": top_k,
+                            "chunks": len(chunks), "labels_without_relevant_chunk": unanswerable,
+                            "embed_s": round(embed_s, 3), "build_s": round(build_s, 3),
+                            "index_mb": round(index_bytes / 1e6, 3),
+                            **evaluate(collection, query_embeddings, relevant, top_k, ef_search),
+                        })
+                shutil.rmtree(path, ignore_errors=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    meeting = [result for result in results if result["recall_at_k"] >= args.recall_target]
+    print(json.dumps({
+        "labels": len(labels),
+        "embedding_model": server_settings.EMBEDDING_MODEL,
+        "query_embed_ms": round(query_embed_ms, 3),
+        "recall_target": args.recall_target,
+        "recommended": min(meeting, key=lambda result: (result["query_p95_ms"], -result["mrr"])) if meeting else None,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", default=LABELS)
+    parser.add_argument("--data-dir", default=server_settings.DATA_DIR)
+    parser.add_argument("--chunk-sizes", type=int_list, default=[200, 400, 800])
+    parser.add_argument("--overlaps", type=int_list, default=[0, 50])
+    parser.add_argument("--top-k", type=int_list, default=[1, 3, 5])
+    parser.add_argument("--m", type=int_list, default=[16], help="HNSW max neighbors per node")
+    parser.add_argument("--ef-construction", type=int_list, default=[100])
+    parser.add_argument("--ef-search", type=int_list, default=[10, 100])
+    parser.add_argument("--min-coverage", type=float, default=0.5,
+                        help="share of the labelled passage a chunk must contain to be relevant")
+    parser.add_argument("--recall-target", type=float, default=0.8)
+    main(parser.parse_args())
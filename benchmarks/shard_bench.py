@@ -0,0 +1,151 @@
+"""
+Query throughput of the sharded vector index (VECTOR_SHARDS) on one machine.
+
+For each shard count, indexes the same synthetic embeddings (random unit vectors, no
+embedding model needed) into the shared corpus collection, 1 being the plain in-process
+collection, then runs `search_vector_database` from `--concurrency` threads as the app's
+request threads do and reports, per shard count:
+
+- indexing time, query throughput (QPS) and latency (p50 / p95 / p99)
+- recall@k against exact (brute force) nearest neighbours
+- the speedup over a single shard
+
+Expect throughput to grow with the shard count up to the number of cores, the shard
+processes searching in parallel.
+
+    PYTHONPATH=. python benchmarks/shard_bench.py --chunks 200000 --shards 1,2,4,8 --concurrency 16
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from concurrency_bench import percentile
+
+from app.core.config import settings as server_settings
+from app.services import embedding_service
+from app.services.retriever_service import search_vector_database
+from app.services.shard_service import stop_shards
+
+
+def int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def unit_vectors(rng, count: int, dim: int) -> np.ndarray:
+    vectors = rng.normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run_queries(collection, queries: np.ndarray, total: int, concurrency: int, top_k: int, ef_search: int):
+    """Run `total` searches from `concurrency` threads, returning the latencies and the elapsed time."""
+    latencies = []
+    results = {}
+    lock = threading.Lock()
+    next_query = iter(range(total))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(next_query, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            found = search_vector_database(collection, queries[i % len(queries)], top_k=top_k, ef_search=ef_search)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                results[i % len(queries)] = [result["id"] for result in found]
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started, results
+
+
+def bench(args, shards: int, workdir: str, ids: list[str], vectors: np.ndarray, queries: np.ndarray,
+          exact: list[set]) -> dict:
+    server_settings.VECTOR_SHARDS = shards
+    server_settings.VECTOR_DB_PATH = os.path.join(workdir, "chroma")
+    embedding_service.get_chroma_client.cache_clear()
+
+    started = time.perf_counter()
+    collection = embedding_service.get_or_create_collection()
+    startup_s = time.perf_counter() - started
+    try:
+        started = time.perf_counter()
+        for i in range(0, len(ids), args.batch):
+            collection.upsert(ids=ids[i:i + args.batch], embeddings=vectors[i:i + args.batch].tolist(),
+                              documents=[f"chunk {j}" for j in range(i, min(i + args.batch, len(ids)))])
+        index_s = time.perf_counter() - started
+
+        # warm the indexes (loaded lazily) before measuring
+        run_queries(collection, queries, min(len(queries), args.concurrency * 2), args.concurrency, args.top_k,
+                    args.ef_search)
+        latencies, elapsed, results = run_queries(collection, queries, args.queries, args.concurrency, args.top_k,
+                                                  args.ef_search)
+    finally:
+        stop_shards()
+
+    recall = [len(exact[i] & set(found)) / args.top_k for i, found in results.items()]
+    return {
+        "shards": shards,
+        "startup_s": round(startup_s, 3),
+        "index_s": round(index_s, 3),
+        "qps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "recall_at_k": round(sum(recall) / len(recall), 4),
+    }
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    vectors = unit_vectors(rng, args.chunks, args.dim)
+    queries = unit_vectors(rng, args.distinct_queries, args.dim)
+    ids = [f"synthetic/{i:08d}_chunk_0" for i in range(args.chunks)]
+    exact = [{ids[i] for i in np.argsort(-(vectors @ query))[:args.top_k]} for query in queries]
+
+    results = []
+    for shards in args.shards:
+        workdir = tempfile.mkdtemp(prefix=f"shard_bench_{shards}_")
+        try:
+            results.append(bench(args, shards, workdir, ids, vectors, queries, exact))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(json.dumps(results[-1]), flush=True)
+
+    baseline = results[0]["qps"]
+    for result in results:
+        result["speedup"] = round(result["qps"] / baseline, 2)
+    print(json.dumps({
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "hnsw_search_ef": server_settings.HNSW_SEARCH_EF,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000, help="vectors in the index")
+    parser.add_argument("--dim", type=int, default=384, help="dimension, 384 as the default embedding model")
+    parser.add_argument("--shards", type=int_list, default=[1, 2, 4], help="shard counts, 1 = unsharded")
+    parser.add_argument("--concurrency", type=int, default=16, help="threads searching concurrently")
+    parser.add_argument("--queries", type=int, default=2000, help="searches per shard count")
+    parser.add_argument("--distinct-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--ef-search", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=5000, help="chunks per upsert")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
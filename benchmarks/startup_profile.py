@@ -0,0 +1,74 @@
+"""
+Startup profiler: import-time breakdown of the app and a bound on its cold start.
+
+Imports the app in a fresh interpreter with `python -X importtime`, prints the slowest
+modules (cumulative time) and the total, and exits with an error when the cold import
+takes longer than --max-seconds or pulls in a module that must stay lazy (ML models,
+vector store, LLM clients). Run it from the repo root, e.g. in CI:
+
+    python benchmarks/startup_profile.py --max-seconds 3
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# heavy dependencies only loaded on first use (or by the warmup phase), never at import
+LAZY_MODULES = ["torch", "sentence_transformers", "transformers", "chromadb", "llama_index.core",
+                "langchain_text_splitters"]
+
+
+def profile(module: str) -> dict:
+    code = (f"import sys, json; import {module}; "
+            f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))")
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True,
+                            text=True, env=dict(os.environ, PYTHONPATH=str(ROOT)))
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    modules = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                        "self_s": int(self_us) / 1e6, "cumulative_s": int(cumulative_us) / 1e6})
+    total = next((m["cumulative_s"] for m in modules if m["module"] == module), 0.0)
+    return {"module": module, "import_s": total, "process_wall_s": wall, "modules": modules,
+            "eager_lazy_modules": json.loads(result.stdout.strip().splitlines()[-1])}
+
+
+def main(args):
+    report = profile(args.module)
+    slowest = sorted((m for m in report["modules"] if m["depth"] <= args.depth),
+                     key=lambda m: m["cumulative_s"], reverse=True)[:args.top]
+    print(f"{'cumulative':>10} {'self':>8}  module")
+    for m in slowest:
+        print(f"{m['cumulative_s']:9.3f}s {m['self_s']:7.3f}s  {'  ' * m['depth']}{m['module']}")
+    print(f"\nimport {args.module}: {report['import_s']:.3f}s (interpreter + import: {report['process_wall_s']:.3f}s)")
+
+    failures = []
+    if report["eager_lazy_modules"]:
+        failures.append(f"modules that should be lazy were imported: {', '.join(report['eager_lazy_modules'])}")
+    if args.max_seconds is not None and report["import_s"] > args.max_seconds:
+        failures.append(f"import took {report['import_s']:.3f}s > {args.max_seconds}s")
+    if failures:
+        sys.exit("FAIL: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=25, help="number of modules listed")
+    parser.add_argument("--depth", type=int, default=3, help="max nesting depth of the listed modules")
+    parser.add_argument("--max-seconds", type=float, default=None, help="fail above this cold import time")
+    main(parser.parse_args())